@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# -------------------------
+# Achievements catalog
+# -------------------------
+# Shared by /achievements/me and the recompute CLI so both award the same
+# titles. Each entry: (title, description, points, earned, progress).
+CatalogEntry = Tuple[str, str, int, bool, float]
+
+
+def distinct_exercises(db: Session) -> List[str]:
+    """Exercises present in the system across both tiers (for "10 in Each")."""
+    return list({
+        r[0].lower()
+        for r in db.execute(
+            text("SELECT DISTINCT exercise FROM results UNION SELECT DISTINCT exercise FROM result_rollups")
+        ).fetchall()
+    })
+
+
+def normalize_exercise_totals(rows: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for exercise, total in rows:  # normalize lower-case
+        totals[exercise.lower()] = totals.get(exercise.lower(), 0) + total
+    return totals
+
+
+def evaluate_catalog(
+    total_reps: int,
+    total_sessions: int,
+    exercise_totals: Dict[str, int],
+    exercises: List[str],
+    persisted_titles: Set[str],
+) -> List[CatalogEntry]:
+    catalog = []
+
+    # Newcomer: award when user has zero sessions (new user) OR if already persisted
+    newcomer_earned = total_sessions == 0 or "Newcomer" in persisted_titles
+    catalog.append(("Newcomer", "Welcome to KhelSaksham!", 20, newcomer_earned,
+                    1.0 if newcomer_earned else 0.0))
+
+    # First Recording
+    first_recording_earned = total_sessions >= 1 or "First Recording" in persisted_titles
+    catalog.append(("First Recording", "Completed your first workout recording", 50, first_recording_earned,
+                    1.0 if first_recording_earned else 0.0))
+
+    # 10 in Each: requires there to be known exercises in the system;
+    # User must have >=10 reps in every distinct exercise that exists in DB
+    ten_each_earned = False
+    ten_each_progress = 0.0
+    if exercises:
+        # compute fraction of exercises where user has >=10 reps
+        cnt_met = sum(1 for ex in exercises if exercise_totals.get(ex, 0) >= 10)
+        ten_each_progress = cnt_met / len(exercises)
+        ten_each_earned = cnt_met == len(exercises)
+    catalog.append(("10 in Each", "Complete 10 reps in every exercise", 120, ten_each_earned, min(1.0, ten_each_progress)))
+
+    # Total reps thresholds (Century Club / Half K / K Legend)
+    catalog.append(("Century Club", "Completed 100 total reps", 100, total_reps >= 100, min(1.0, total_reps / 100.0)))
+    catalog.append(("Half K Hero", "Completed 500 total reps", 200, total_reps >= 500, min(1.0, total_reps / 500.0)))
+    catalog.append(("K Legend", "Completed 1000 total reps", 500, total_reps >= 1000, min(1.0, total_reps / 1000.0)))
+
+    # Jump King: check user total jump-like reps (case-insensitive partial match)
+    jump_count = sum(tot for ex_name, tot in exercise_totals.items() if "jump" in ex_name)
+    catalog.append(("Jump King", "Achieved 50 total jumps", 120, jump_count >= 50, min(1.0, jump_count / 50.0)))
+
+    # You can expand catalog with more rules using same pattern
+    return catalog
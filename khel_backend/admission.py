@@ -0,0 +1,151 @@
+import json
+from typing import Dict, Iterable, Optional
+import jwt
+from khel_backend.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    UPLOAD_MAX_CONCURRENT,
+    UPLOAD_MAX_PER_USER,
+    UPLOAD_MAX_INFLIGHT_BYTES,
+    UPLOAD_MAX_FILE_BYTES,
+    UPLOAD_RETRY_AFTER_SECONDS,
+    AVATAR_MAX_BYTES,
+)
+
+UPLOAD_PATHS = {"/upload", "/submit", "/profile/avatar"}
+# Paths whose endpoint accepts less than UPLOAD_MAX_FILE_BYTES. Limits apply to
+# the whole request body, so leave room for the multipart framing.
+_MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_PATH_LIMITS = {"/profile/avatar": AVATAR_MAX_BYTES + _MULTIPART_OVERHEAD}
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class UploadAdmissionMiddleware:
+    """
+    Admission control for upload endpoints, applied before the body is read.
+
+    - 413 when Content-Length (or the streamed body) exceeds the path's limit
+      in UPLOAD_PATH_LIMITS, or UPLOAD_MAX_FILE_BYTES for other paths
+    - 429 when the caller already has UPLOAD_MAX_PER_USER uploads in flight
+    - 503 when UPLOAD_MAX_CONCURRENT uploads or UPLOAD_MAX_INFLIGHT_BYTES are in use
+
+    Rejections carry Retry-After and return immediately instead of queueing.
+    Limits are per worker process; all state is touched only on the event loop.
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: Iterable[str] = UPLOAD_PATHS,
+        max_concurrent: int = UPLOAD_MAX_CONCURRENT,
+        max_per_user: int = UPLOAD_MAX_PER_USER,
+        max_inflight_bytes: int = UPLOAD_MAX_INFLIGHT_BYTES,
+        max_file_bytes: int = UPLOAD_MAX_FILE_BYTES,
+        path_limits: Optional[Dict[str, int]] = None,
+        retry_after: int = UPLOAD_RETRY_AFTER_SECONDS,
+    ):
+        self.app = app
+        self.paths = set(paths)
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_file_bytes = max_file_bytes
+        self.path_limits = dict(UPLOAD_PATH_LIMITS if path_limits is None else path_limits)
+        self.retry_after = retry_after
+        self.active = 0
+        self.inflight_bytes = 0
+        self.per_user: Dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_file_bytes)
+        headers = dict(scope["headers"])
+        try:
+            length = int(headers[b"content-length"]) if b"content-length" in headers else None
+        except ValueError:
+            await self._reject(send, 400, "Invalid Content-Length")
+            return
+        if length is not None and length > max_bytes:
+            await self._reject(send, 413, f"Upload exceeds {max_bytes} bytes")
+            return
+
+        # without a Content-Length, assume the worst case for the byte budget
+        reserved = length if length is not None else max_bytes
+        user = _caller(headers)
+        if self.active >= self.max_concurrent or self.inflight_bytes + reserved > self.max_inflight_bytes:
+            await self._reject(send, 503, "Upload capacity exhausted, retry later", self.retry_after)
+            return
+        if user is not None and self.per_user.get(user, 0) >= self.max_per_user:
+            await self._reject(send, 429, "Too many concurrent uploads", self.retry_after)
+            return
+
+        self.active += 1
+        self.inflight_bytes += reserved
+        if user is not None:
+            self.per_user[user] = self.per_user.get(user, 0) + 1
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    too_large = True
+                    raise _TooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                return  # the app's error response is replaced by our 413
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _TooLarge:
+            pass
+        finally:
+            self.active -= 1
+            self.inflight_bytes -= reserved
+            if user is not None:
+                self.per_user[user] -= 1
+                if not self.per_user[user]:
+                    del self.per_user[user]
+        if too_large and not response_started:
+            await self._reject(send, 413, f"Upload exceeds {max_bytes} bytes")
+
+    async def _reject(self, send, status: int, detail: str, retry_after: Optional[int] = None):
+        body = json.dumps({"detail": detail}).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _caller(headers: dict) -> Optional[str]:
+    """User id from the bearer token, without a DB lookup; None if absent or invalid."""
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    return str(payload.get("sub"))
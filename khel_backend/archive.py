@@ -0,0 +1,233 @@
+import argparse
+import datetime
+import time
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from khel_backend import database
+from khel_backend import models
+from khel_backend.config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_BATCH_PAUSE_SECONDS,
+)
+
+# -------------------------
+# Tier-spanning SQL
+# -------------------------
+# Drop-in replacement for `results` in queries that need full history.
+ALL_RESULTS = (
+    "(SELECT id, user_id, exercise, reps, video_url, video_hash, timestamp FROM results "
+    "UNION ALL "
+    "SELECT id, user_id, exercise, reps, video_url, video_hash, timestamp FROM results_archive)"
+)
+
+# Per-exercise totals across both tiers: hot rows plus the archived rollup.
+EXERCISE_TOTALS = (
+    "(SELECT user_id, exercise, SUM(reps) AS total_reps, COUNT(*) AS sessions, MAX(reps) AS best_reps "
+    "FROM results GROUP BY user_id, exercise "
+    "UNION ALL "
+    "SELECT user_id, exercise, total_reps, sessions, best_reps FROM result_rollups)"
+)
+
+
+def ensure_indexes(engine=None):
+    """
+    Per-user queries on both tiers filter on user_id. create_all() skips
+    tables that already exist, so add any missing indexes explicitly.
+    """
+    engine = engine or database.engine
+    for table in (models.Result.__table__, models.ArchivedResult.__table__):
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def user_totals(db: Session, user_id: int) -> dict:
+    """Total reps, sessions and best single workout for a user across both tiers."""
+    hot = db.execute(
+        text(
+            "SELECT COALESCE(SUM(reps), 0), COUNT(*), COALESCE(MAX(reps), 0) "
+            "FROM results WHERE user_id = :uid"
+        ),
+        {"uid": user_id},
+    ).fetchone()
+    cold = db.execute(
+        text(
+            "SELECT COALESCE(SUM(total_reps), 0), COALESCE(SUM(sessions), 0), COALESCE(MAX(best_reps), 0) "
+            "FROM result_rollups WHERE user_id = :uid"
+        ),
+        {"uid": user_id},
+    ).fetchone()
+    return {
+        "total_reps": hot[0] + cold[0],
+        "sessions": hot[1] + cold[1],
+        "best_reps": max(hot[2], cold[2]),
+    }
+
+
+def user_best(db: Session, user_id: int, exercise: Optional[str] = None) -> int:
+    """Best single workout for a user across both tiers, optionally for one exercise."""
+    where = "WHERE user_id = :uid" + (" AND exercise = :exercise" if exercise else "")
+    params = {"uid": user_id, "exercise": exercise}
+    hot = db.execute(text(f"SELECT COALESCE(MAX(reps), 0) FROM results {where}"), params).scalar()
+    cold = db.execute(text(f"SELECT COALESCE(MAX(best_reps), 0) FROM result_rollups {where}"), params).scalar()
+    return max(hot, cold)
+
+
+# -------------------------
+# Rollup writer lock
+# -------------------------
+# archive_batch() adds archived rows to result_rollups with `+=` while the
+# recompute CLI overwrites rollups from results_archive. On Postgres a
+# recompute statement could wait on archival's row locks, then overwrite
+# its increments with totals from an older snapshot. Both writers therefore
+# take this transaction-scoped advisory lock first. SQLite already runs one
+# write transaction at a time, so there's nothing to do there.
+ROLLUP_LOCK_ID = 742501
+
+
+def lock_rollups(db: Session):
+    """Serialize result_rollups writers until the current transaction ends."""
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ROLLUP_LOCK_ID})
+
+
+# -------------------------
+# Postgres partitions
+# -------------------------
+def _ensure_partitions(db: Session, max_id: int, cutoff: datetime.datetime):
+    """Create yearly partitions of results_archive for the rows about to move."""
+    years = db.execute(
+        text(
+            "SELECT DISTINCT CAST(EXTRACT(YEAR FROM timestamp) AS INTEGER) FROM results "
+            "WHERE id <= :max_id AND timestamp < :cutoff"
+        ),
+        {"max_id": max_id, "cutoff": cutoff},
+    ).scalars().all()
+    for year in years:
+        db.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS results_archive_{year} PARTITION OF results_archive "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+        )
+
+
+# -------------------------
+# Compaction job
+# -------------------------
+_ARCHIVE_ROWS = (
+    "INSERT INTO results_archive (id, user_id, exercise, reps, video_url, video_hash, timestamp) "
+    "SELECT id, user_id, exercise, reps, video_url, video_hash, timestamp FROM {source}"
+)
+_FOLD_ROLLUPS = (
+    "INSERT INTO result_rollups (user_id, exercise, total_reps, sessions, best_reps) "
+    "SELECT user_id, exercise, SUM(reps), COUNT(*), MAX(reps) FROM {source} "
+    "GROUP BY user_id, exercise "
+    "ON CONFLICT (user_id, exercise) DO UPDATE SET "
+    "total_reps = result_rollups.total_reps + excluded.total_reps, "
+    "sessions = result_rollups.sessions + excluded.sessions, "
+    "best_reps = CASE WHEN excluded.best_reps > result_rollups.best_reps "
+    "THEN excluded.best_reps ELSE result_rollups.best_reps END"
+)
+# On Postgres (READ COMMITTED) each statement takes a fresh snapshot, so a row
+# with a backdated timestamp committed between a separate INSERT and DELETE
+# would be deleted without being archived. Deleting first and feeding the
+# archive and the rollups from the deleted rows does the move in one statement.
+_MOVE_BATCH = (
+    "WITH moved AS (DELETE FROM results {where} "
+    "RETURNING id, user_id, exercise, reps, video_url, video_hash, timestamp), "
+    f"archived AS ({_ARCHIVE_ROWS.format(source='moved')}), "
+    f"folded AS ({_FOLD_ROLLUPS.format(source='moved')}) "
+    "SELECT COUNT(*) FROM moved"
+)
+
+
+def archive_batch(db: Session, cutoff: datetime.datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move the oldest `batch_size` results before `cutoff` into the archive tier
+    in one transaction and fold them into result_rollups. Returns rows moved.
+
+    The batch is bounded by id rather than an IN list: every hot row with
+    id <= max_id and timestamp < cutoff is exactly the selected batch, since
+    new rows always get larger ids.
+    """
+    lock_rollups(db)
+    max_id = db.execute(
+        text(
+            "SELECT MAX(id) FROM (SELECT id FROM results WHERE timestamp < :cutoff "
+            "ORDER BY id LIMIT :n) batch"
+        ),
+        {"cutoff": cutoff, "n": batch_size},
+    ).scalar()
+    if max_id is None:
+        db.rollback()  # release the lock
+        return 0
+
+    params = {"max_id": max_id, "cutoff": cutoff}
+    where = "WHERE id <= :max_id AND timestamp < :cutoff"
+    try:
+        if db.bind.dialect.name == "postgresql":
+            _ensure_partitions(db, max_id, cutoff)
+            moved = db.execute(text(_MOVE_BATCH.format(where=where)), params).scalar()
+        else:
+            # SQLite holds its single write lock from the first INSERT to the
+            # commit, so all three statements see the same rows
+            db.execute(text(_ARCHIVE_ROWS.format(source=f"results {where}")), params)
+            db.execute(text(_FOLD_ROLLUPS.format(source=f"results {where}")), params)
+            moved = db.execute(text(f"DELETE FROM results {where}"), params).rowcount
+        db.commit()
+        return moved
+    except Exception:
+        db.rollback()
+        raise
+
+
+def run_archival(
+    horizon_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+    max_batches: Optional[int] = None,
+) -> int:
+    """
+    Archive everything older than the horizon, one committed batch at a time.
+    Each batch is atomic, so an interrupted run simply resumes where it left
+    off on the next call. Sleeps `pause` seconds between batches to limit load.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=horizon_days)
+    total, batches = 0, 0
+    db = database.SessionLocal()
+    try:
+        while max_batches is None or batches < max_batches:
+            moved = archive_batch(db, cutoff, batch_size)
+            if not moved:
+                break
+            total += moved
+            batches += 1
+            if pause:
+                time.sleep(pause)
+    finally:
+        db.close()
+    return total
+
+
+# -------------------------
+# CLI
+# -------------------------
+# python -m khel_backend.archive --horizon-days 180
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old results into the archive tier.")
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=ARCHIVE_BATCH_PAUSE_SECONDS)
+    parser.add_argument("--max-batches", type=int)
+    args = parser.parse_args(argv)
+    if args.horizon_days < 8:
+        parser.error("--horizon-days must be at least 8 (the dashboard reads the last week from hot results)")
+
+    moved = run_archival(args.horizon_days, args.batch_size, args.pause, args.max_batches)
+    print(f"archived {moved} results")
+
+
+if __name__ == "__main__":
+    main()
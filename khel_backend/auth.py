@@ -7,7 +7,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from khel_backend import database 
 from khel_backend import models
-from khel_backend.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_HOURS
+from khel_backend.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_HOURS, ADMIN_USERNAMES
 
 # -------------------------
 # Security Setup
@@ -16,6 +16,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # OAuth2PasswordBearer expects a login route where tokens are retrieved
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# same, but lets unauthenticated requests through (token is None)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 # -------------------------
 # Token Expiry Settings
@@ -79,23 +81,39 @@ def decode_token(token: str, expected_type: str = "access") -> str:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # -------------------------
-# DB Dependency
+# DB Dependencies
 # -------------------------
 def get_db():
+    """Session on the primary, for routes that write"""
     db = database.SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def get_read_db(token: str = Depends(optional_oauth2_scheme)):
+    """Session on the read replica, unless this user wrote within READ_YOUR_WRITES_SECONDS"""
+    try:
+        user_id = decode_token(token, expected_type="access") if token else None
+    except HTTPException:
+        user_id = None  # rejected by get_current_reader
+    # without a replica every read already hits the primary
+    sticky = (
+        user_id is not None
+        and database.read_engine is not database.engine
+        and database.is_sticky(int(user_id))
+    )
+    db = database.SessionLocal() if sticky else database.ReadSessionLocal()
+    db.info["replica"] = not sticky and database.read_engine is not database.engine
+    try:
+        yield db
+    finally:
+        db.close()
+
 # -------------------------
-# Auth Dependency
+# Auth Dependencies
 # -------------------------
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    """Retrieve the current logged-in user from the access token"""
+def _load_user(token: str, db: Session):
     user_id = decode_token(token, expected_type="access")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -105,3 +123,27 @@ def get_current_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     return user
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Retrieve the current logged-in user from the access token"""
+    user = _load_user(token, db)
+    # commits on this session mark the user for read-your-writes
+    db.info["user_id"] = user.id
+    return user
+
+def get_current_reader(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_read_db)
+):
+    """Same as get_current_user, loaded through the read session"""
+    return _load_user(token, db)
+
+
+def get_admin_user(current_user: models.User = Depends(get_current_user)):
+    """Allow only users listed in ADMIN_USERNAMES"""
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
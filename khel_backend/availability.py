@@ -0,0 +1,161 @@
+import hashlib
+import math
+import threading
+import time
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from khel_backend import models
+from khel_backend.config import (
+    BLOOM_EXPECTED_USERS,
+    BLOOM_FP_RATE,
+    BLOOM_REFRESH_SECONDS,
+    BLOOM_REFRESH_LOOKBACK_IDS,
+)
+
+
+# -------------------------
+# Bloom filter
+# -------------------------
+class BloomFilter:
+    """
+    Standard Bloom filter with double hashing over one blake2b digest.
+
+    For n keys at false-positive rate p it uses m = -n ln p / (ln 2)^2 bits and
+    k = (m / n) ln 2 hashes. Each user adds two keys (username and email), so at
+    10M users and p = 1%: n = 20M, m ~= 192M bits = 24 MB, k = 7.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = BLOOM_FP_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+
+def _username_key(username: str) -> str:
+    return "u:" + username
+
+
+def _email_key(email: str) -> str:
+    return "e:" + email.lower()
+
+
+# -------------------------
+# Taken usernames / emails
+# -------------------------
+class TakenNames:
+    """
+    Filter of every username and email in use. A negative answer is
+    definitive; a possible hit is confirmed against the database.
+
+    Each worker keeps its own filter and catches up on writes made by other
+    workers by scanning users.id and user_changes.id past the last seen ids,
+    at most once per BLOOM_REFRESH_SECONDS. Ids from a sequence can commit out
+    of order, so each scan also re-reads the last BLOOM_REFRESH_LOOKBACK_IDS
+    ids below the mark; re-adding a key is harmless.
+    """
+
+    def __init__(self):
+        self._filter: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+        self._last_user_id = 0
+        self._last_change_id = 0
+        self._next_refresh = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def build(self, db: Session, batch_size: int = 10000):
+        count = db.execute(text("SELECT COUNT(*) FROM users")).scalar() or 0
+        # leave headroom so growth doesn't push the error rate up before a rebuild
+        bloom = BloomFilter(max(BLOOM_EXPECTED_USERS, count * 2) * 2)
+        last_change_id = db.execute(text("SELECT COALESCE(MAX(id), 0) FROM user_changes")).scalar()
+        last_user_id = 0
+        rows = db.execute(
+            text("SELECT id, username, email FROM users ORDER BY id").execution_options(
+                stream_results=True, yield_per=batch_size
+            )
+        )
+        for user_id, username, email in rows:
+            bloom.add(_username_key(username))
+            bloom.add(_email_key(email))
+            last_user_id = user_id
+        with self._lock:
+            self._filter = bloom
+            self._last_user_id = last_user_id
+            self._last_change_id = last_change_id
+
+    def add(self, username: Optional[str] = None, email: Optional[str] = None):
+        with self._lock:
+            if self._filter is None:
+                return
+            if username:
+                self._filter.add(_username_key(username))
+            if email:
+                self._filter.add(_email_key(email))
+
+    def refresh(self, db: Session):
+        """Pick up users registered and emails changed since the last refresh."""
+        now = time.monotonic()
+        with self._lock:
+            if self._filter is None or now < self._next_refresh:
+                return
+            self._next_refresh = now + BLOOM_REFRESH_SECONDS
+            last_user_id, last_change_id = self._last_user_id, self._last_change_id
+        users = db.execute(
+            text("SELECT id, username, email FROM users WHERE id > :last ORDER BY id"),
+            {"last": last_user_id - BLOOM_REFRESH_LOOKBACK_IDS},
+        ).fetchall()
+        changes = db.execute(
+            text(
+                "SELECT c.id, u.email FROM user_changes c JOIN users u ON u.id = c.user_id "
+                "WHERE c.id > :last AND c.kind = 'profile' ORDER BY c.id"
+            ),
+            {"last": last_change_id - BLOOM_REFRESH_LOOKBACK_IDS},
+        ).fetchall()
+        with self._lock:
+            for user_id, username, email in users:
+                self._filter.add(_username_key(username))
+                self._filter.add(_email_key(email))
+                self._last_user_id = max(self._last_user_id, user_id)
+            for change_id, email in changes:
+                self._filter.add(_email_key(email))
+                self._last_change_id = max(self._last_change_id, change_id)
+
+    def _maybe_taken(self, key: str) -> bool:
+        with self._lock:
+            return self._filter is None or key in self._filter
+
+    def username_available(self, db: Session, username: str) -> bool:
+        if not self._maybe_taken(_username_key(username)):
+            return True
+        return db.query(models.User.id).filter(models.User.username == username).first() is None
+
+    def email_available(self, db: Session, email: str) -> bool:
+        if not self._maybe_taken(_email_key(email)):
+            return True
+        return db.query(models.User.id).filter(models.User.email == email).first() is None
+
+
+taken_names = TakenNames()
@@ -0,0 +1,114 @@
+import asyncio
+import io
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from khel_backend.config import (
+    AVATAR_SIZES,
+    AVATAR_FORMAT,
+    AVATAR_MAX_PIXELS,
+    AVATAR_WORKERS,
+    FIREBASE_BUCKET,
+)
+
+# -------------------------
+# Avatar variants
+# -------------------------
+# Uploads are decoded, square-cropped and re-encoded into AVATAR_SIZES. The
+# stored avatar_url points at the largest variant; the others share its name
+# apart from the size suffix, so no extra columns are needed.
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+_CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+# Only names written by upload_variants() in our own bucket; any other URL
+# (e.g. set through PATCH /profile/me) is external and left alone.
+_PUBLIC_PREFIX = f"https://storage.googleapis.com/{FIREBASE_BUCKET}/"
+_VARIANT_RE = re.compile(
+    "^(?P<base>" + re.escape(_PUBLIC_PREFIX) + r"avatars/\d+/[0-9a-f]{12}_)(?P<size>\d+)\.(?P<ext>webp|jpg)$"
+)
+
+SMALL_AVATAR = min(AVATAR_SIZES)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _render(data: bytes, sizes, fmt: str, max_pixels: int) -> Dict[int, bytes]:
+    """Runs in a worker process: decode once, emit every variant."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        # open() only reads the header; refuse before decoding the bitmap
+        if img.width * img.height > max_pixels:
+            raise ValueError(f"image is {img.width}x{img.height}, at most {max_pixels} pixels allowed")
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        side = min(img.size)
+        left, top = (img.width - side) // 2, (img.height - side) // 2
+        img = img.crop((left, top, left + side, top + side))
+        options = {"quality": 82, "method": 4} if fmt == "webp" else {"quality": 82, "optimize": True}
+        out = {}
+        # largest first so each step downsamples a smaller image
+        for size in sorted(sizes, reverse=True):
+            img = img.resize((min(size, side), min(size, side)), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format=fmt.upper(), **options)
+            out[size] = buf.getvalue()
+        return out
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=AVATAR_WORKERS)
+    return _pool
+
+
+async def render_variants(data: bytes) -> Dict[int, bytes]:
+    """
+    Resize in the process pool without holding a request thread. Raises
+    BrokenProcessPool if a worker died (e.g. OOM-killed); the pool is then
+    replaced so later uploads get a fresh one.
+    """
+    global _pool
+    pool = _executor()
+    try:
+        future = pool.submit(_render, data, AVATAR_SIZES, AVATAR_FORMAT, AVATAR_MAX_PIXELS)
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        if _pool is pool:
+            _pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+def upload_variants(bucket, user_id: int, variants: Dict[int, bytes]) -> str:
+    """Upload every variant under one versioned name; returns the largest variant's URL."""
+    ext = _EXTENSIONS[AVATAR_FORMAT]
+    version = uuid.uuid4().hex[:12]
+    url = None
+    for size in sorted(variants):
+        blob = bucket.blob(f"avatars/{user_id}/{version}_{size}.{ext}")
+        # names are never reused, so clients and CDNs may cache forever
+        blob.cache_control = "public, max-age=31536000, immutable"
+        blob.upload_from_string(variants[size], content_type=_CONTENT_TYPES[AVATAR_FORMAT])
+        blob.make_public()
+        url = blob.public_url
+    return url
+
+
+def variant_url(avatar_url: Optional[str], size: int = SMALL_AVATAR) -> Optional[str]:
+    """URL of a resized variant; external avatar URLs are returned unchanged."""
+    if not avatar_url:
+        return avatar_url
+    m = _VARIANT_RE.match(avatar_url)
+    if not m or int(m.group("size")) not in AVATAR_SIZES:
+        return avatar_url
+    return f"{m.group('base')}{size}.{m.group('ext')}"
+
+
+def variant_urls(avatar_url: Optional[str]) -> Optional[Dict[str, str]]:
+    m = _VARIANT_RE.match(avatar_url) if avatar_url else None
+    if not m or int(m.group("size")) not in AVATAR_SIZES:
+        return None
+    return {str(size): variant_url(avatar_url, size) for size in AVATAR_SIZES}
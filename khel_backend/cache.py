@@ -0,0 +1,344 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+from khel_backend.config import (
+    CACHE_BACKEND,
+    CACHE_URL,
+    CACHE_LOCAL_SIZE,
+    CACHE_TTL_SECONDS,
+    CACHE_SYNC_INTERVAL_MS,
+)
+
+# -------------------------
+# How invalidation works
+# -------------------------
+# Keys live in namespaces ("user:42", "leaderboard"). Each namespace has a
+# generation number in the shared tier, and the generation is part of every
+# stored key. Invalidating a namespace bumps its generation and appends
+# (namespace, generation) to a shared log; every worker tails that log at most
+# once per CACHE_SYNC_INTERVAL_MS, so stale entries simply stop being hit in
+# both tiers and age out by LRU/TTL.
+
+
+# -------------------------
+# Local tier
+# -------------------------
+class LocalLRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# -------------------------
+# Shared tiers
+# -------------------------
+class SQLiteSharedStore:
+    """Shared tier in a local SQLite file, usable by every worker on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS cache_generations (
+                ns TEXT PRIMARY KEY, gen INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS cache_invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT, ns TEXT NOT NULL,
+                gen INTEGER NOT NULL, at REAL NOT NULL);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread and per process (connections don't survive fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+
+    def generation(self, ns: str) -> int:
+        row = self._conn().execute("SELECT gen FROM cache_generations WHERE ns = ?", (ns,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, ns: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO cache_generations (ns, gen) VALUES (?, 1) "
+                "ON CONFLICT (ns) DO UPDATE SET gen = gen + 1",
+                (ns,),
+            )
+            gen = conn.execute("SELECT gen FROM cache_generations WHERE ns = ?", (ns,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO cache_invalidations (ns, gen, at) VALUES (?, ?, ?)", (ns, gen, time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return gen
+
+    def latest_cursor(self):
+        return self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations").fetchone()[0]
+
+    def changes_since(self, cursor) -> Tuple[Any, List[Tuple[str, int]]]:
+        rows = self._conn().execute(
+            "SELECT seq, ns, gen FROM cache_invalidations WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        if not rows:
+            return cursor, []
+        return rows[-1][0], [(ns, gen) for _, ns, gen in rows]
+
+    def prune(self, log_age: float = 600):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM cache_invalidations WHERE at < ?", (now - log_age,))
+
+
+class RedisSharedStore:
+    """Shared tier on any Redis-compatible server; needs the `redis` package."""
+
+    STREAM = "cache:invalidations"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(f"cache:{key}")
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(f"cache:{key}", value, px=int(ttl * 1000))
+
+    def generation(self, ns: str) -> int:
+        return int(self.client.get(f"cache:gen:{ns}") or 0)
+
+    def bump(self, ns: str) -> int:
+        gen = self.client.incr(f"cache:gen:{ns}")
+        self.client.xadd(self.STREAM, {"ns": ns, "gen": gen}, maxlen=100000, approximate=True)
+        return gen
+
+    def latest_cursor(self):
+        last = self.client.xrevrange(self.STREAM, count=1)
+        return last[0][0] if last else "0-0"
+
+    def changes_since(self, cursor) -> Tuple[Any, List[Tuple[str, int]]]:
+        entries = self.client.xrange(self.STREAM, min=f"({cursor}")
+        if not entries:
+            return cursor, []
+        return entries[-1][0], [(fields["ns"], int(fields["gen"])) for _, fields in entries]
+
+    def prune(self, log_age: float = 600):
+        pass  # entries expire via TTL, the stream is capped by MAXLEN
+
+
+# -------------------------
+# Tiered cache
+# -------------------------
+class TieredCache:
+    def __init__(
+        self,
+        shared=None,
+        local_size: int = CACHE_LOCAL_SIZE,
+        ttl: float = CACHE_TTL_SECONDS,
+        sync_interval: float = CACHE_SYNC_INTERVAL_MS / 1000.0,
+    ):
+        self.shared = shared
+        self.local = LocalLRU(local_size)
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._gens: "OrderedDict[str, int]" = OrderedDict()
+        self._gens_max = local_size * 4
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._next_sync = 0.0
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _sync(self):
+        """Apply invalidations published by other workers since the last poll."""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + self.sync_interval
+            cursor = self._cursor
+        try:
+            if cursor is None:
+                # start from the tail: generations are fetched lazily per namespace
+                new_cursor, changes = self.shared.latest_cursor(), []
+            else:
+                new_cursor, changes = self.shared.changes_since(cursor)
+        except Exception:
+            return  # shared tier down: retry on the next poll
+        with self._lock:
+            self._cursor = new_cursor
+            for ns, gen in changes:
+                if ns in self._gens and gen > self._gens[ns]:
+                    self._gens[ns] = gen
+
+    def _generation(self, ns: str) -> int:
+        with self._lock:
+            gen = self._gens.get(ns)
+            if gen is not None:
+                self._gens.move_to_end(ns)
+                return gen
+        gen = 0
+        if self.shared is not None:
+            try:
+                gen = self.shared.generation(ns)
+            except Exception:
+                pass
+        with self._lock:
+            gen = max(gen, self._gens.get(ns, 0))
+            self._gens[ns] = gen
+            while len(self._gens) > self._gens_max:
+                self._gens.popitem(last=False)
+        return gen
+
+    def get_or_set(
+        self,
+        ns: str,
+        name: str,
+        loader: Callable[[], Any],
+        ttl: Optional[float] = None,
+        store_if: Optional[Callable[[], bool]] = None,
+    ):
+        """Return the cached value for (ns, name), calling `loader` on a miss.
+        Values must be JSON-serializable to reach the shared tier. `store_if`
+        is checked after loading; when it returns False the value is returned
+        but not cached."""
+        self._sync()
+        key = f"{ns}@{self._generation(ns)}:{name}"
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+        ttl = ttl or self.ttl
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception:
+                raw = None  # shared tier down: behave as a local-only cache
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value, ttl)
+                self.stats["shared_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        value = loader()
+        if store_if is not None and not store_if():
+            return value
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, json.dumps(value), ttl)
+            except Exception:
+                pass
+        return value
+
+    def invalidate(self, *namespaces: str):
+        """
+        Best-effort: callers invalidate after committing, so a shared-tier
+        failure must not turn a saved write into an error. This worker still
+        stops serving the namespace; other workers catch up when their
+        entries expire (CACHE_TTL_SECONDS).
+        """
+        for ns in namespaces:
+            gen = None
+            if self.shared is not None:
+                try:
+                    gen = self.shared.bump(ns)
+                except Exception as e:
+                    print(f"Cache invalidation of {ns} failed: {e}")
+            with self._lock:
+                if gen is None:
+                    gen = self._gens.get(ns, 0) + 1
+                self._gens[ns] = max(gen, self._gens.get(ns, 0))
+
+    def mark(self, key: str, ttl: float):
+        """Short-lived marker visible to every worker (best-effort)."""
+        self.local.set(f"mark:{key}", True, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(f"mark:{key}", "1", ttl)
+            except Exception as e:
+                print(f"Cache mark of {key} failed: {e}")
+
+    def is_marked(self, key: str) -> bool:
+        if self.local.get(f"mark:{key}"):
+            return True
+        if self.shared is not None:
+            try:
+                return self.shared.get(f"mark:{key}") is not None
+            except Exception:
+                return False
+        return False
+
+    def prune(self):
+        if self.shared is not None:
+            self.shared.prune()
+
+
+def create_cache(backend: str = CACHE_BACKEND, url: str = CACHE_URL) -> TieredCache:
+    if backend == "local":
+        return TieredCache()
+    if backend == "sqlite":
+        return TieredCache(SQLiteSharedStore(url))
+    if backend == "redis":
+        return TieredCache(RedisSharedStore(url))
+    raise RuntimeError(f"Unknown CACHE_BACKEND '{backend}', expected local, sqlite or redis")
+
+
+cache = create_cache()
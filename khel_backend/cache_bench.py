@@ -0,0 +1,113 @@
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from khel_backend.cache import TieredCache, SQLiteSharedStore, RedisSharedStore
+
+# -------------------------
+# Multi-worker cache benchmark
+# -------------------------
+# python -m khel_backend.cache_bench --workers 1 4 8
+#
+# Each worker process stands in for one uvicorn worker: it gets an equal share
+# of the requests (as a load balancer would spread them), reads per-user
+# entries with a skewed key distribution, and invalidates on a fraction of
+# requests like /submit does. A miss costs --db-ms of simulated query time.
+
+
+def _zipf_user(rng: random.Random, users: int) -> int:
+    # ~80% of traffic to ~20% of users
+    return int(users * rng.random() ** 3)
+
+
+def _worker(backend, url, requests, users, write_ratio, db_ms, seed, out):
+    shared = None
+    if backend == "sqlite":
+        shared = SQLiteSharedStore(url)
+    elif backend == "redis":
+        shared = RedisSharedStore(url)
+    cache = TieredCache(shared)
+    rng = random.Random(seed)
+    latencies = []
+
+    def load(uid):
+        time.sleep(db_ms / 1000.0)
+        return {"user_id": uid, "total_reps": uid * 7}
+
+    for _ in range(requests):
+        uid = _zipf_user(rng, users)
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            cache.invalidate(f"user:{uid}")
+        else:
+            cache.get_or_set(f"user:{uid}", "dashboard", lambda: load(uid))
+            latencies.append(time.perf_counter() - start)
+    out.put((cache.stats, latencies))
+
+
+def run(backend, url, workers, total_requests, users, write_ratio, db_ms):
+    out = multiprocessing.Queue()
+    per_worker = total_requests // workers
+    procs = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(backend, url, per_worker, users, write_ratio, db_ms, seed, out),
+        )
+        for seed in range(workers)
+    ]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+    latencies = []
+    for s, lat in results:
+        for k in stats:
+            stats[k] += s[k]
+        latencies.extend(lat)
+    reads = sum(stats.values()) or 1
+    latencies.sort()
+    return {
+        "hit_rate": (stats["local_hits"] + stats["shared_hits"]) / reads,
+        "local": stats["local_hits"] / reads,
+        "shared": stats["shared_hits"] / reads,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "rps": per_worker * workers / elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cache hit rate and latency across worker processes.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backends", nargs="+", default=["local", "sqlite"],
+                        choices=["local", "sqlite", "redis"])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--requests", type=int, default=40000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.02)
+    parser.add_argument("--db-ms", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    print(f"{'backend':<8} {'workers':>7} {'hit%':>6} {'local%':>7} {'shared%':>8} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'req/s':>8}")
+    for backend in args.backends:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                url = args.redis_url if backend == "redis" else os.path.join(tmp, "cache.db")
+                if backend == "sqlite":
+                    SQLiteSharedStore(url)  # create tables before workers race for it
+                r = run(backend, url, workers, args.requests, args.users, args.write_ratio, args.db_ms)
+            print(f"{backend:<8} {workers:>7} {r['hit_rate'] * 100:>6.1f} {r['local'] * 100:>7.1f} "
+                  f"{r['shared'] * 100:>8.1f} {r['p50_ms']:>7.3f} {r['p99_ms']:>7.3f} {r['rps']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
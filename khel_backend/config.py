@@ -11,6 +11,11 @@ load_dotenv()
 # Database
 # -------------------------
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./results.db")
+# Optional read replica for GET routes, e.g. a second SQLite file or Postgres
+# standby; unset means reads also go to DATABASE_URL
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+# After a write, that user's reads stay on the primary for this long
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
 
 # -------------------------
 # JWT / Security
@@ -18,6 +23,8 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./results.db")
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("ACCESS_TOKEN_EXPIRE_HOURS", "24"))
+# Comma-separated usernames allowed to call /admin/* routes
+ADMIN_USERNAMES = {u.strip() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()}
 
 # -------------------------
 # Firebase
@@ -27,3 +34,112 @@ FIREBASE_SERVICE_ACCOUNT = json.loads(os.getenv("FIREBASE_SERVICE_ACCOUNT"))
 
 # Firebase storage bucket
 FIREBASE_BUCKET = os.getenv("FIREBASE_BUCKET", "khelsakasham.firebasestorage.app")
+
+# -------------------------
+# Percentiles
+# -------------------------
+# Reps histograms use fixed-width buckets up to PERCENTILE_MAX_REPS (plus one
+# overflow bucket); width 1 gives exact mid-rank percentiles below the cap.
+# Changing either requires `python -m khel_backend.percentile --rebuild`.
+PERCENTILE_MAX_REPS = int(os.getenv("PERCENTILE_MAX_REPS", "500"))
+PERCENTILE_BUCKET_WIDTH = int(os.getenv("PERCENTILE_BUCKET_WIDTH", "1"))
+
+# -------------------------
+# Archival
+# -------------------------
+# Results older than ARCHIVE_AFTER_DAYS move to results_archive in batches of
+# ARCHIVE_BATCH_SIZE, pausing ARCHIVE_BATCH_PAUSE_SECONDS between batches.
+# The horizon is kept above a week so the dashboard's weekly trend stays hot.
+ARCHIVE_AFTER_DAYS = max(8, int(os.getenv("ARCHIVE_AFTER_DAYS", "365")))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv("ARCHIVE_BATCH_PAUSE_SECONDS", "0.5"))
+# How often the background job runs; 0 disables it (use the CLI instead)
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# -------------------------
+# Cache
+# -------------------------
+# local: per-worker LRU only; sqlite: LRU + shared SQLite file (all workers on
+# one host); redis: LRU + Redis-compatible server at CACHE_URL
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_URL = os.getenv(
+    "CACHE_URL", "redis://localhost:6379/0" if CACHE_BACKEND == "redis" else "./cache.db"
+)
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+# Max delay before a worker sees another worker's invalidation
+CACHE_SYNC_INTERVAL_MS = int(os.getenv("CACHE_SYNC_INTERVAL_MS", "50"))
+# The leaderboard is not invalidated on writes; it just expires this often
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "15"))
+
+# -------------------------
+# Upload admission control
+# -------------------------
+# Per worker process. Uploads beyond these limits get a fast 429/503 with
+# Retry-After instead of queueing behind each other.
+UPLOAD_MAX_CONCURRENT = int(os.getenv("UPLOAD_MAX_CONCURRENT", "8"))
+UPLOAD_MAX_PER_USER = int(os.getenv("UPLOAD_MAX_PER_USER", "2"))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.getenv("UPLOAD_MAX_INFLIGHT_BYTES", str(400 * 1024 * 1024)))
+UPLOAD_RETRY_AFTER_SECONDS = int(os.getenv("UPLOAD_RETRY_AFTER_SECONDS", "5"))
+# Worker threads kept free for non-upload routes (/login, /leaderboard, ...);
+# the threadpool is sized to UPLOAD_MAX_CONCURRENT + this at startup
+RESERVED_READ_THREADS = int(os.getenv("RESERVED_READ_THREADS", "32"))
+
+# -------------------------
+# Profiling
+# -------------------------
+# Off by default: nothing is installed unless PROFILE_ENABLED=1. When on, admins
+# profile a request with the `X-Profile: 1` header, and PROFILE_SAMPLE_RATE
+# (0..1) additionally profiles a random share of all requests.
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+# -------------------------
+# Avatars
+# -------------------------
+AVATAR_SIZES = tuple(int(s) for s in os.getenv("AVATAR_SIZES", "48,128,512").split(","))
+AVATAR_FORMAT = os.getenv("AVATAR_FORMAT", "webp")  # webp or jpeg
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(10 * 1024 * 1024)))
+# Decoded size cap; a small compressed file can still expand to a huge bitmap
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", str(25_000_000)))
+# Processes used for decoding/resizing, per API worker
+AVATAR_WORKERS = int(os.getenv("AVATAR_WORKERS", "2"))
+
+# -------------------------
+# Delta sync
+# -------------------------
+# Change log rows older than this are pruned; clients whose version predates
+# the retained log get a full snapshot instead of a delta
+SYNC_LOG_RETENTION_DAYS = int(os.getenv("SYNC_LOG_RETENTION_DAYS", "30"))
+
+# -------------------------
+# Username / email availability
+# -------------------------
+# Bloom filter sizing: expected user count and target false-positive rate
+BLOOM_EXPECTED_USERS = int(os.getenv("BLOOM_EXPECTED_USERS", "1000000"))
+BLOOM_FP_RATE = float(os.getenv("BLOOM_FP_RATE", "0.01"))
+# How often a worker picks up registrations made by other workers
+BLOOM_REFRESH_SECONDS = float(os.getenv("BLOOM_REFRESH_SECONDS", "1"))
+# Ids re-scanned below the last seen id on each refresh: sequence ids can
+# commit out of order, so a row may appear after a higher id was seen
+BLOOM_REFRESH_LOOKBACK_IDS = int(os.getenv("BLOOM_REFRESH_LOOKBACK_IDS", "1000"))
+
+# -------------------------
+# Idempotency keys
+# -------------------------
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits for the in-flight original before getting a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# A pending key older than this is assumed abandoned (worker crash) and taken over
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT_SECONDS", "300"))
+
+# -------------------------
+# Batch recompute (python -m khel_backend.recompute)
+# -------------------------
+RECOMPUTE_CHUNK_SIZE = int(os.getenv("RECOMPUTE_CHUNK_SIZE", "2000"))
+RECOMPUTE_WORKERS = int(os.getenv("RECOMPUTE_WORKERS", str(os.cpu_count() or 4)))
+RECOMPUTE_CHECKPOINT = os.getenv("RECOMPUTE_CHECKPOINT", "recompute.checkpoint.json")
@@ -0,0 +1,234 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+import zlib
+from typing import Iterator, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from khel_backend import database
+from khel_backend.archive import ALL_RESULTS
+
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+EXPORT_COLUMNS = [
+    "id", "user_id", "username", "age", "location", "sport",
+    "exercise", "reps", "timestamp", "video_url", "video_hash",
+]
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# -------------------------
+# Reader
+# -------------------------
+def iter_batches(
+    db: Session,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    exercise: Optional[str] = None,
+    location: Optional[str] = None,
+    batch_size: int = 5000,
+) -> Iterator[List[dict]]:
+    """Yield lists of at most `batch_size` export rows, ordered by result id."""
+    query = (
+        # spans hot and archived results
+        "SELECT r.id, r.user_id, u.username, u.age, u.location, u.sport, "
+        "r.exercise, r.reps, r.timestamp, r.video_url, r.video_hash "
+        f"FROM {ALL_RESULTS} r JOIN users u ON u.id = r.user_id WHERE 1 = 1"
+    )
+    params = {}
+    if start:
+        query += " AND r.timestamp >= :start"
+        params["start"] = start
+    if end:
+        query += " AND r.timestamp < :end"
+        params["end"] = end
+    if exercise:
+        query += " AND r.exercise = :exercise"
+        params["exercise"] = exercise
+    if location:
+        query += " AND LOWER(u.location) = :location"
+        params["location"] = location.strip().lower()
+    query += " ORDER BY r.id"
+
+    result = db.execute(
+        text(query).execution_options(stream_results=True, yield_per=batch_size),
+        params,
+    )
+    for chunk in result.partitions(batch_size):
+        yield [
+            {
+                col: (str(val) if col == "timestamp" and val is not None else val)
+                for col, val in zip(EXPORT_COLUMNS, row)
+            }
+            for row in chunk
+        ]
+
+
+# -------------------------
+# Writers
+# -------------------------
+def _ndjson_chunks(batches: Iterator[List[dict]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(row) + "\n" for row in batch).encode()
+
+
+def _csv_chunks(batches: Iterator[List[dict]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose buffered bytes can be taken after each batch."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def check_format(fmt: str):
+    """Raise ValueError for formats that cannot be produced in this environment."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+def _parquet_chunks(batches: Iterator[List[dict]], compression: str = "snappy") -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("username", pa.string()),
+        ("age", pa.int32()), ("location", pa.string()), ("sport", pa.string()),
+        ("exercise", pa.string()), ("reps", pa.int32()), ("timestamp", pa.string()),
+        ("video_url", pa.string()), ("video_hash", pa.string()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for batch in batches:
+            # one row group per batch keeps the writer's memory bounded
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    gz = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        out = gz.compress(chunk)
+        if out:
+            yield out
+    yield gz.flush()
+
+
+def encode(batches: Iterator[List[dict]], fmt: str, gzip: bool = False) -> Iterator[bytes]:
+    check_format(fmt)
+    if fmt == "parquet":
+        # Parquet compresses column pages itself, so gzip is applied there
+        return _parquet_chunks(batches, compression="gzip" if gzip else "snappy")
+    chunks = _ndjson_chunks(batches) if fmt == "ndjson" else _csv_chunks(batches)
+    return _gzip_chunks(chunks) if gzip else chunks
+
+
+def stream_export(fmt: str, gzip: bool = False, batch_size: int = 5000, **filters) -> Iterator[bytes]:
+    """
+    Yield the encoded export through a server-side cursor on its own read session,
+    so it can outlive the request's DB dependency inside a StreamingResponse.
+    Memory is bounded by `batch_size` rows regardless of table size.
+    """
+    db = database.ReadSessionLocal()
+    try:
+        yield from encode(iter_batches(db, batch_size=batch_size, **filters), fmt, gzip)
+    finally:
+        db.close()
+
+
+def export_filename(fmt: str, gzip: bool = False) -> str:
+    name = f"results-{datetime.datetime.utcnow():%Y%m%d%H%M%S}.{fmt}"
+    return name + ".gz" if gzip and fmt != "parquet" else name
+
+
+# -------------------------
+# CLI
+# -------------------------
+# python -m khel_backend.export --format csv --gzip --out results.csv.gz \
+#     --start 2025-01-01 --exercise pushup
+def _parse_date(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export results joined with users.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--start", type=_parse_date, help="inclusive ISO date/time")
+    parser.add_argument("--end", type=_parse_date, help="exclusive ISO date/time")
+    parser.add_argument("--exercise")
+    parser.add_argument("--location")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+    try:
+        check_format(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in stream_export(
+            args.format,
+            gzip=args.gzip,
+            batch_size=args.batch_size,
+            start=args.start,
+            end=args.end,
+            exercise=args.exercise,
+            location=args.location,
+        ):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import datetime
+import hashlib
+import json
+import time
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from khel_backend import database
+from khel_backend import models
+from khel_backend.config import (
+    IDEMPOTENCY_TTL_HOURS,
+    IDEMPOTENCY_WAIT_SECONDS,
+    IDEMPOTENCY_PENDING_TIMEOUT_SECONDS,
+)
+
+# -------------------------
+# Idempotency-Key support
+# -------------------------
+# claim() runs before any side effect and commits a pending row on its own
+# session so concurrent duplicates see it immediately. The endpoint then calls
+# complete() in the same transaction as its own writes, so the stored response
+# and the Result row commit (or roll back) together. On failure, release()
+# frees the key so the client can retry.
+
+
+def _replay(row: models.IdempotencyKey) -> JSONResponse:
+    return JSONResponse(
+        status_code=row.response_code,
+        content=json.loads(row.response_body),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def request_hash(params: dict) -> str:
+    """Fingerprint of the request parameters a retry must repeat exactly."""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def claim(user_id: int, key: str, endpoint: str, params: dict) -> Optional[JSONResponse]:
+    """
+    Claim `key` for this request. Returns None when the caller should do the
+    work, or the stored response when an earlier request with the same
+    parameters already finished. Waits up to IDEMPOTENCY_WAIT_SECONDS for an
+    in-flight duplicate. Reusing a key with different parameters is a 422.
+    """
+    if len(key) > 100:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 100 characters")
+    fingerprint = request_hash(params)
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    db = database.SessionLocal()
+    try:
+        while True:
+            now = datetime.datetime.utcnow()
+            claimed = db.execute(
+                text(
+                    "INSERT INTO idempotency_keys "
+                    "(user_id, key, endpoint, request_hash, status, created_at, expires_at) "
+                    "VALUES (:uid, :key, :endpoint, :hash, 'pending', :now, :expires) "
+                    "ON CONFLICT (user_id, key) DO NOTHING"
+                ),
+                {
+                    "uid": user_id,
+                    "key": key,
+                    "endpoint": endpoint,
+                    "hash": fingerprint,
+                    "now": now,
+                    "expires": now + datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+                },
+            ).rowcount
+            db.commit()
+            if claimed:
+                return None
+
+            row = db.query(models.IdempotencyKey).filter_by(user_id=user_id, key=key).first()
+            if row is None:
+                continue  # released between our insert and select
+            if row.endpoint != endpoint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was used for a different endpoint")
+            if row.expires_at <= now:
+                db.execute(
+                    text("DELETE FROM idempotency_keys WHERE user_id = :uid AND key = :key AND expires_at <= :now"),
+                    {"uid": user_id, "key": key, "now": now},
+                )
+                db.commit()
+                continue
+            if row.request_hash != fingerprint:
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was used with different request parameters"
+                )
+            if row.status == "done":
+                return _replay(row)
+            stale = now - datetime.timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT_SECONDS)
+            if row.created_at < stale:
+                # original worker died mid-request; take the key over atomically
+                taken = db.execute(
+                    text(
+                        "UPDATE idempotency_keys SET created_at = :now "
+                        "WHERE user_id = :uid AND key = :key AND status = 'pending' AND created_at = :old"
+                    ),
+                    {"now": now, "uid": user_id, "key": key, "old": row.created_at},
+                ).rowcount
+                db.commit()
+                if taken:
+                    return None
+                continue
+
+            if time.monotonic() >= deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "5"},
+                )
+            db.expunge_all()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+    finally:
+        db.close()
+
+
+def complete(db: Session, user_id: int, key: str, status_code: int, body: dict):
+    """Record the response in the caller's transaction; commits with it."""
+    db.execute(
+        text(
+            "UPDATE idempotency_keys SET status = 'done', response_code = :code, response_body = :body "
+            "WHERE user_id = :uid AND key = :key"
+        ),
+        {"code": status_code, "body": json.dumps(body), "uid": user_id, "key": key},
+    )
+
+
+def release(user_id: int, key: str):
+    """Forget a pending key after a failed request so a retry can run."""
+    db = database.SessionLocal()
+    try:
+        db.execute(
+            text("DELETE FROM idempotency_keys WHERE user_id = :uid AND key = :key AND status = 'pending'"),
+            {"uid": user_id, "key": key},
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_expired() -> int:
+    db = database.SessionLocal()
+    try:
+        deleted = db.execute(
+            text("DELETE FROM idempotency_keys WHERE expires_at < :now"),
+            {"now": datetime.datetime.utcnow()},
+        ).rowcount
+        db.commit()
+        return deleted
+    finally:
+        db.close()
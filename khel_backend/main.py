@@ -1,7 +1,8 @@
 from sqlalchemy import text
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse
 from khel_backend import database 
 from khel_backend import models
 from khel_backend.auth import (
@@ -10,11 +11,38 @@ from khel_backend.auth import (
     create_access_token,
     create_refresh_token,
     decode_token,
+    get_db,
+    get_read_db,
     get_current_user,
+    get_current_reader,
+    get_admin_user,
 )
 from khel_backend.schemas import RegisterIn, LoginIn, ResultIn, ProfileUpdateIn
-from khel_backend.config import FIREBASE_SERVICE_ACCOUNT, FIREBASE_BUCKET
-import uuid, firebase_admin, datetime
+from khel_backend.config import (
+    FIREBASE_SERVICE_ACCOUNT,
+    FIREBASE_BUCKET,
+    ARCHIVE_INTERVAL_SECONDS,
+    UPLOAD_MAX_CONCURRENT,
+    RESERVED_READ_THREADS,
+    PROFILE_ENABLED,
+    AVATAR_MAX_BYTES,
+    LEADERBOARD_TTL_SECONDS,
+    UPLOAD_RETRY_AFTER_SECONDS,
+)
+from khel_backend.percentile import record_percentile, query_percentile, seed_percentiles, AGE_BAND_LABELS
+from khel_backend import export
+from khel_backend.archive import ALL_RESULTS, EXERCISE_TOTALS, user_totals, user_best, run_archival, ensure_indexes
+from khel_backend.cache import cache
+from khel_backend.admission import UploadAdmissionMiddleware
+from khel_backend import profiling
+from khel_backend import avatars
+from khel_backend.sync import record_change, changes_since, prune_changes
+from khel_backend.availability import taken_names
+from khel_backend import idempotency
+from khel_backend.achievements import distinct_exercises, normalize_exercise_totals, evaluate_catalog
+from fastapi.concurrency import run_in_threadpool
+import uuid, firebase_admin, datetime, asyncio, anyio
+from concurrent.futures.process import BrokenProcessPool
 from firebase_admin import credentials, storage
 
 # -------------------------
@@ -22,6 +50,12 @@ from firebase_admin import credentials, storage
 # -------------------------
 app = FastAPI()
 
+if PROFILE_ENABLED:
+    profiling.install(app)
+
+# added before CORS so rejections still carry CORS headers
+app.add_middleware(UploadAdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://khelsakasham.web.app",
@@ -32,6 +66,75 @@ app.add_middleware(
 )
 
 models.Base.metadata.create_all(bind=database.engine)
+ensure_indexes()
+
+
+@app.on_event("startup")
+async def reserve_read_threads():
+    # sync routes share one threadpool; size it so that even with every upload
+    # slot busy, RESERVED_READ_THREADS remain for light endpoints
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, UPLOAD_MAX_CONCURRENT + RESERVED_READ_THREADS)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(asyncio.to_thread(seed_percentiles))
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        asyncio.create_task(archive_old_results())
+    asyncio.create_task(prune_cache())
+    asyncio.create_task(prune_sync_log())
+    asyncio.create_task(purge_idempotency_keys())
+    asyncio.create_task(asyncio.to_thread(build_taken_names))
+
+
+def build_taken_names():
+    db = database.ReadSessionLocal()
+    try:
+        taken_names.build(db)
+    except Exception as e:
+        print(f"Availability filter build failed: {e}")
+    finally:
+        db.close()
+
+
+async def archive_old_results():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(run_archival)
+        except Exception as e:
+            print(f"Archival run failed: {e}")
+
+
+async def prune_cache():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await asyncio.to_thread(cache.prune)
+        except Exception as e:
+            print(f"Cache prune failed: {e}")
+
+
+async def prune_sync_log():
+    while True:
+        await asyncio.sleep(3600)
+        db = database.SessionLocal()
+        try:
+            await asyncio.to_thread(prune_changes, db)
+        except Exception as e:
+            print(f"Sync log prune failed: {e}")
+        finally:
+            db.close()
+
+
+async def purge_idempotency_keys():
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            await asyncio.to_thread(idempotency.purge_expired)
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
 
 # -------------------------
 # Firebase Config
@@ -44,18 +147,6 @@ try:
 except Exception as e:
     raise RuntimeError(f"Firebase initialization failed: {e}")
 
-# -------------------------
-# Utils
-# -------------------------
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
@@ -82,9 +173,32 @@ def register(user: RegisterIn, db: Session = Depends(get_db)):
     )
     db.add(new_user)
     db.commit()
+    database.mark_write(new_user.id)
+    taken_names.add(new_user.username, new_user.email)
     return {"status": "registered"}
 
 
+@app.get("/register/available")
+def register_available(
+    username: str = None,
+    email: str = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Check username and/or email availability for the signup form. Answered
+    from an in-memory Bloom filter; only possible hits query the database.
+    """
+    if not username and not email:
+        raise HTTPException(status_code=400, detail="username or email required")
+    taken_names.refresh(db)
+    out = {}
+    if username:
+        out["username"] = {"value": username, "available": taken_names.username_available(db, username)}
+    if email:
+        out["email"] = {"value": email, "available": taken_names.email_available(db, email)}
+    return out
+
+
 @app.post("/login")
 def login(user: LoginIn, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter_by(email=user.email).first()
@@ -124,8 +238,8 @@ def upload_video(
 
         unique_name = f"{uuid.uuid4()}_{file.filename}"
         blob = bucket.blob(f"videos/{unique_name}")
-        content = file.file.read()
-        blob.upload_from_string(content, content_type=file.content_type)
+        # stream from the spooled temp file instead of buffering it in memory
+        blob.upload_from_file(file.file, content_type=file.content_type)
         blob.make_public()
         return {"video_url": blob.public_url}
     except Exception as e:
@@ -135,6 +249,7 @@ def upload_video(
 @app.post("/results")
 def save_result(
     item: ResultIn,
+    idempotency_key: str = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
@@ -143,6 +258,11 @@ def save_result(
     if not item.exercise.strip():
         raise HTTPException(status_code=400, detail="Exercise name required")
 
+    if idempotency_key:
+        replay = idempotency.claim(current_user.id, idempotency_key, "/results", item.model_dump(mode="json"))
+        if replay is not None:
+            return replay
+
     try:
         new = models.Result(
             user_id=current_user.id,
@@ -153,9 +273,19 @@ def save_result(
             timestamp=item.timestamp,
         )
         db.add(new)
+        db.flush()
+        record_change(db, current_user.id, "result", new.id)
+        record_percentile(db, item.exercise, item.reps, current_user.age, current_user.location)
+        response = {"status": "ok"}
+        if idempotency_key:
+            idempotency.complete(db, current_user.id, idempotency_key, 200, response)
         db.commit()
-        return {"status": "ok"}
+        cache.invalidate(f"user:{current_user.id}")
+        return response
     except Exception as e:
+        db.rollback()
+        if idempotency_key:
+            idempotency.release(current_user.id, idempotency_key)
         raise HTTPException(status_code=500, detail=f"Result save failed: {e}")
 
 
@@ -165,6 +295,7 @@ def submit_result(
     exercise: str = Form(...),
     reps: int = Form(...),
     video_hash: str = Form(...),
+    idempotency_key: str = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
@@ -173,11 +304,21 @@ def submit_result(
     if not exercise.strip():
         raise HTTPException(status_code=400, detail="Exercise name required")
 
+    # claim before the storage upload so a retried submit never uploads twice
+    if idempotency_key:
+        replay = idempotency.claim(
+            current_user.id,
+            idempotency_key,
+            "/submit",
+            {"exercise": exercise, "reps": reps, "video_hash": video_hash, "filename": file.filename},
+        )
+        if replay is not None:
+            return replay
+
     try:
         unique_name = f"{uuid.uuid4()}_{file.filename}"
         blob = bucket.blob(f"videos/{unique_name}")
-        content = file.file.read()
-        blob.upload_from_string(content, content_type=file.content_type)
+        blob.upload_from_file(file.file, content_type=file.content_type)
         blob.make_public()
         video_url = blob.public_url
 
@@ -189,9 +330,19 @@ def submit_result(
             video_hash=video_hash,
         )
         db.add(new)
+        db.flush()
+        record_change(db, current_user.id, "result", new.id)
+        record_percentile(db, exercise, reps, current_user.age, current_user.location)
+        response = {"status": "ok", "video_url": video_url}
+        if idempotency_key:
+            idempotency.complete(db, current_user.id, idempotency_key, 200, response)
         db.commit()
-        return {"status": "ok", "video_url": video_url}
+        cache.invalidate(f"user:{current_user.id}")
+        return response
     except Exception as e:
+        db.rollback()
+        if idempotency_key:
+            idempotency.release(current_user.id, idempotency_key)
         raise HTTPException(status_code=500, detail=f"Submit failed: {e}")
 
 # -------------------------
@@ -200,27 +351,43 @@ def submit_result(
 @app.get("/leaderboard")
 def leaderboard(
     exercise: str = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
 ):
-    try:
-        query = """
-            SELECT u.id, u.username, u.avatar_url, u.location, u.sport, COALESCE(MAX(r.reps), 0) AS best
+    exercise_filter = " AND r.exercise = :exercise" if exercise else ""
+    params = {"exercise": exercise}
+
+    def load_top():
+        # best per user spans hot results and archived rollups
+        query = f"""
+            SELECT u.id, u.username, u.avatar_url, u.location, u.sport, COALESCE(MAX(r.best_reps), 0) AS best
             FROM users u
-            LEFT JOIN results r ON r.user_id = u.id
+            LEFT JOIN {EXERCISE_TOTALS} r ON r.user_id = u.id{exercise_filter}
+            GROUP BY u.id, u.username, u.avatar_url, u.location, u.sport
+            ORDER BY best DESC, u.id
+            LIMIT 20
+        """
+        return [list(r) for r in db.execute(text(query), params).fetchall()]
+
+    def load_best_counts():
+        # [best, number of users with that best], highest first; small (one row per distinct best)
+        query = f"""
+            SELECT best, COUNT(*) FROM (
+                SELECT r.user_id, MAX(r.best_reps) AS best FROM {EXERCISE_TOTALS} r
+                WHERE 1 = 1{exercise_filter} GROUP BY r.user_id
+            ) b GROUP BY best ORDER BY best DESC
         """
-        params = {}
-        if exercise:
-            # Add filter into the JOIN so users with no results still show (best=0)
-            query += " AND r.exercise = :exercise"
-            params["exercise"] = exercise
+        return [list(r) for r in db.execute(text(query), params).fetchall()]
 
-        query += " GROUP BY u.id, u.username, u.avatar_url, u.location, u.sport ORDER BY best DESC"
+    try:
+        # shared by all callers and not invalidated on writes: it only expires,
+        # so write traffic can't force the full aggregate on every request
+        key = exercise or "*"
+        top = cache.get_or_set("leaderboard", f"top:{key}", load_top, ttl=LEADERBOARD_TTL_SECONDS)
+        best_counts = cache.get_or_set("leaderboard", f"counts:{key}", load_best_counts, ttl=LEADERBOARD_TTL_SECONDS)
 
-        rows = db.execute(text(query), params).fetchall()
         leaderboard_list, current_rank, prev_best, user_rank_info = [], 1, None, None
-
-        for i, r in enumerate(rows):
+        for i, r in enumerate(top):
             best = r[5]
             if prev_best is not None and best < prev_best:
                 current_rank = i + 1
@@ -228,7 +395,7 @@ def leaderboard(
                 "rank": current_rank,
                 "user_id": r[0],
                 "username": r[1],
-                "avatar_url": r[2],
+                "avatar_url": avatars.variant_url(r[2]),
                 "location": r[3],
                 "sport": r[4],
                 "best": best,
@@ -239,23 +406,78 @@ def leaderboard(
                 user_rank_info = entry
             prev_best = best
 
-        return {"top": leaderboard_list[:20], "current_user": user_rank_info}
+        if user_rank_info is None:
+            # rank = 1 + number of users with a strictly higher best
+            best = user_best(db, current_user.id, exercise)
+            user_rank_info = {
+                "rank": 1 + sum(count for b, count in best_counts if b > best),
+                "user_id": current_user.id,
+                "username": current_user.username,
+                "avatar_url": avatars.variant_url(current_user.avatar_url),
+                "location": current_user.location,
+                "sport": current_user.sport,
+                "best": best,
+                "is_current_user": True,
+            }
+
+        return {"top": leaderboard_list, "current_user": user_rank_info}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Leaderboard fetch failed: {e}")
 
+# -------------------------
+# Peer Percentiles
+# -------------------------
+@app.get("/percentile")
+def percentile(
+    exercise: str,
+    reps: int,
+    age_band: str = None,
+    location: str = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
+):
+    """
+    Percentile of `reps` among all recorded results for the exercise, optionally
+    narrowed to an age band and/or location. Served from the sparse per-segment
+    histograms in percentile_buckets; `error_bound` is the maximum error in
+    percentage points.
+    """
+    if age_band and age_band not in AGE_BAND_LABELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown age_band, expected one of: {', '.join(AGE_BAND_LABELS)}",
+        )
+    return query_percentile(db, exercise, reps, age_band, location)
+
 # -------------------------
 # User Profile & History
 # -------------------------
+def user_cached(db: Session, user: models.User, name: str, loader):
+    """
+    Per-user cache lookup. A replica read that races the user's own write
+    could fill the post-write generation with lagging data for every worker,
+    so replica results are not stored once the user is sticky. Stickiness is
+    checked after the load: a write marked later also bumps the generation
+    later, leaving any stored value under the old one.
+    """
+    return cache.get_or_set(
+        f"user:{user.id}",
+        name,
+        loader,
+        store_if=lambda: not (db.info.get("replica") and database.is_sticky(user.id)),
+    )
+
+
 @app.get("/user/history")
 def user_history(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
 ):
-    try:
+    def load():
         rows = db.execute(
             text(
                 "SELECT exercise, reps, timestamp, video_url "
-                "FROM results WHERE user_id = :uid ORDER BY timestamp DESC"
+                f"FROM {ALL_RESULTS} r WHERE user_id = :uid ORDER BY timestamp DESC"
             ),
             {"uid": current_user.id},
         ).fetchall()
@@ -263,34 +485,36 @@ def user_history(
             {"exercise": r[0], "reps": r[1], "timestamp": str(r[2]), "video_url": r[3]}
             for r in rows
         ]
+
+    try:
+        return user_cached(db, current_user, "history", load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"History fetch failed: {e}")
 
 
+def profile_dict(db: Session, user: models.User) -> dict:
+    total_reps = user_totals(db, user.id)["total_reps"]
+    return {
+        "username": user.username,
+        "email": user.email,
+        "bio": user.bio,
+        "age": user.age,
+        "location": user.location,
+        "sport": user.sport,
+        "avatar_url": avatars.variant_url(user.avatar_url),
+        "avatar_urls": avatars.variant_urls(user.avatar_url),
+        "total_reps": total_reps,
+        "created_at": str(user.created_at),
+    }
+
+
 @app.get("/profile/me")
 def profile_me(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
 ):
     try:
-        total_reps = (
-            db.execute(
-                text("SELECT SUM(reps) FROM results WHERE user_id = :uid"),
-                {"uid": current_user.id},
-            ).scalar()
-            or 0
-        )
-        return {
-            "username": current_user.username,
-            "email": current_user.email,
-            "bio": current_user.bio,
-            "age": current_user.age,
-            "location": current_user.location,
-            "sport": current_user.sport,
-            "avatar_url": current_user.avatar_url,
-            "total_reps": total_reps,
-            "created_at": str(current_user.created_at),
-        }
+        return user_cached(db, current_user, "profile", lambda: profile_dict(db, current_user))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Profile fetch failed: {e}")
 
@@ -311,11 +535,61 @@ def update_profile_me(
         if data.avatar_url is not None:
             current_user.avatar_url = data.avatar_url
 
+        record_change(db, current_user.id, "profile")
         db.commit()
+        cache.invalidate(f"user:{current_user.id}")
+        if data.email is not None:
+            taken_names.add(email=data.email)
         return {"status": "updated"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Profile update failed: {e}")
 
+@app.post("/profile/avatar")
+async def upload_avatar(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Resize an uploaded photo into fixed square variants and store them.
+    Decoding and resizing run in a process pool, storage and DB work in the
+    threadpool, so neither holds the event loop or a request thread idle.
+    """
+    content = await file.read(AVATAR_MAX_BYTES + 1)
+    if not content:
+        raise HTTPException(status_code=400, detail="No file provided")
+    if len(content) > AVATAR_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Avatar exceeds {AVATAR_MAX_BYTES} bytes")
+
+    try:
+        variants = await avatars.render_variants(content)
+    except BrokenProcessPool:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing unavailable, retry later",
+            headers={"Retry-After": str(UPLOAD_RETRY_AFTER_SECONDS)},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    try:
+        avatar_url = await run_in_threadpool(avatars.upload_variants, bucket, current_user.id, variants)
+
+        def save():
+            current_user.avatar_url = avatar_url
+            record_change(db, current_user.id, "profile")
+            db.commit()
+
+        await run_in_threadpool(save)
+        cache.invalidate(f"user:{current_user.id}")
+        return {
+            "status": "updated",
+            "avatar_url": avatars.variant_url(avatar_url),
+            "avatar_urls": avatars.variant_urls(avatar_url),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Avatar upload failed: {e}")
+
 # -------------------------
 # Achievements (custom logic)
 # -------------------------
@@ -329,85 +603,31 @@ def achievements_me(
     Returns a list of achievements with: title, description, earned (bool), progress (0..1), points, earned_at (nullable)
     """
     try:
-        # total reps (coalesce to 0)
-        total_reps = (
-            db.execute(
-                text("SELECT COALESCE(SUM(reps), 0) FROM results WHERE user_id = :uid"),
-                {"uid": current_user.id},
-            ).scalar()
-            or 0
-        )
+        # totals across hot results and archived rollups
+        totals = user_totals(db, current_user.id)
+        total_reps = totals["total_reps"]
 
         # per-exercise totals for this user
         exercise_stats = db.execute(
             text(
-                "SELECT exercise, COALESCE(SUM(reps), 0) as total FROM results WHERE user_id = :uid GROUP BY exercise"
+                f"SELECT exercise, COALESCE(SUM(total_reps), 0) as total FROM {EXERCISE_TOTALS} t "
+                "WHERE user_id = :uid GROUP BY exercise"
             ),
             {"uid": current_user.id},
         ).fetchall()
-        exercise_totals = {row[0].lower(): row[1] for row in exercise_stats}  # normalize lower-case
-
-        # distinct exercises present in the system (to evaluate "10 in each")
-        distinct_exercises = [r[0].lower() for r in db.execute(text("SELECT DISTINCT exercise FROM results")).fetchall()]
+        exercise_totals = normalize_exercise_totals(exercise_stats)
 
         # number of workout submissions
-        total_sessions = (
-            db.execute(
-                text("SELECT COUNT(*) FROM results WHERE user_id = :uid"),
-                {"uid": current_user.id},
-            ).scalar()
-            or 0
-        )
+        total_sessions = totals["sessions"]
 
         # Load existing persisted achievements for this user (titles)
         persisted = db.query(models.Achievement).filter_by(user_id=current_user.id).all()
         persisted_titles = {a.title for a in persisted}
 
-        # Define catalog with evaluation and progress calculation
-        # Each entry: (title, description, points, condition_bool, progress_float)
-        catalog = []
-
-        # Newcomer: award when user has zero sessions (new user) OR if already persisted
-        newcomer_earned = total_sessions == 0 or "Newcomer" in persisted_titles
-        catalog.append(("Newcomer", "Welcome to KhelSaksham!", 20, newcomer_earned,
-                        1.0 if newcomer_earned else 0.0))
-
-        # First Recording
-        first_recording_earned = total_sessions >= 1 or "First Recording" in persisted_titles
-        catalog.append(("First Recording", "Completed your first workout recording", 50, first_recording_earned,
-                        1.0 if first_recording_earned else 0.0))
-
-        # 10 in Each: requires there to be known exercises in the system;
-        # User must have >=10 reps in every distinct exercise that exists in DB
-        ten_each_earned = False
-        ten_each_progress = 0.0
-        if distinct_exercises:
-            # compute fraction of exercises where user has >=10 reps
-            cnt_met = sum(1 for ex in distinct_exercises if exercise_totals.get(ex, 0) >= 10)
-            ten_each_progress = cnt_met / len(distinct_exercises)
-            ten_each_earned = cnt_met == len(distinct_exercises)
-        else:
-            # no exercises in DB yet -> false, progress 0
-            ten_each_earned = False
-            ten_each_progress = 0.0
-        catalog.append(("10 in Each", "Complete 10 reps in every exercise", 120, ten_each_earned, min(1.0, ten_each_progress)))
-
-        # Total reps thresholds (Century Club / Half K / K Legend)
-        catalog.append(("Century Club", "Completed 100 total reps", 100, total_reps >= 100, min(1.0, total_reps / 100.0)))
-        catalog.append(("Half K Hero", "Completed 500 total reps", 200, total_reps >= 500, min(1.0, total_reps / 500.0)))
-        catalog.append(("K Legend", "Completed 1000 total reps", 500, total_reps >= 1000, min(1.0, total_reps / 1000.0)))
-
-        # Jump King: check user total jump-like reps (case-insensitive partial match)
-        jump_count = 0
-        # sum any exercise names containing 'jump'
-        for ex_name, tot in exercise_totals.items():
-            if "jump" in ex_name:
-                jump_count += tot
-        jump_earned = jump_count >= 50
-        jump_progress = min(1.0, jump_count / 50.0)
-        catalog.append(("Jump King", "Achieved 50 total jumps", 120, jump_earned, jump_progress))
-
-        # You can expand catalog with more rules using same pattern
+        # Evaluate catalog with progress calculation
+        catalog = evaluate_catalog(
+            total_reps, total_sessions, exercise_totals, distinct_exercises(db), persisted_titles
+        )
 
         # Persist newly earned achievements (if not already persisted)
         newly_persisted = []
@@ -420,9 +640,12 @@ def achievements_me(
                     earned_at=datetime.datetime.utcnow(),
                 )
                 db.add(ach)
-                newly_persisted.append(title)
+                newly_persisted.append(ach)
 
         if newly_persisted:
+            db.flush()
+            for ach in newly_persisted:
+                record_change(db, current_user.id, "achievement", ach.id)
             db.commit()
             # refresh persisted list
             persisted = db.query(models.Achievement).filter_by(user_id=current_user.id).all()
@@ -460,25 +683,13 @@ def achievements_me(
 # -------------------------
 @app.get("/dashboard/me")
 def dashboard_me(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
 ):
-    try:
-        total_reps = (
-            db.execute(
-                text("SELECT SUM(reps) FROM results WHERE user_id = :uid"),
-                {"uid": current_user.id},
-            ).scalar()
-            or 0
-        )
-
-        best_workout = (
-            db.execute(
-                text("SELECT MAX(reps) FROM results WHERE user_id = :uid"),
-                {"uid": current_user.id},
-            ).scalar()
-            or 0
-        )
+    def load():
+        totals = user_totals(db, current_user.id)
+        total_reps = totals["total_reps"]
+        best_workout = totals["best_reps"]
 
         recent_rows = db.execute(
             text(
@@ -487,6 +698,15 @@ def dashboard_me(
             ),
             {"uid": current_user.id},
         ).fetchall()
+        if len(recent_rows) < 5:
+            # not enough recent hot rows, fall back to both tiers
+            recent_rows = db.execute(
+                text(
+                    f"SELECT exercise, reps, timestamp FROM {ALL_RESULTS} r "
+                    "WHERE user_id = :uid ORDER BY timestamp DESC LIMIT 5"
+                ),
+                {"uid": current_user.id},
+            ).fetchall()
         recent_activity = [
             {"exercise": r[0], "reps": r[1], "timestamp": str(r[2])}
             for r in recent_rows
@@ -512,5 +732,78 @@ def dashboard_me(
             "recent_activity": recent_activity or [],
             "weekly_trend": weekly_trend or [],
         }
+
+    try:
+        return user_cached(db, current_user, "dashboard", load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Dashboard fetch failed: {e}")
+
+# -------------------------
+# Delta Sync
+# -------------------------
+@app.get("/sync")
+def sync(
+    since: int = 0,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader),
+):
+    """
+    Results, achievements and profile changed after `since`, plus the new
+    version to send next time. `full` is true when the client must replace
+    its local copy (first sync, or `since` older than the retained log).
+    """
+    try:
+        delta = changes_since(db, current_user.id, since)
+        profile_changed = delta.pop("profile_changed")
+        delta["profile"] = profile_dict(db, current_user) if profile_changed else None
+        return delta
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Sync failed: {e}")
+
+# -------------------------
+# Admin Export
+# -------------------------
+@app.get("/admin/export")
+def admin_export(
+    format: str = "ndjson",
+    gzip: bool = False,
+    start: datetime.datetime = None,
+    end: datetime.datetime = None,
+    exercise: str = None,
+    location: str = None,
+    admin: models.User = Depends(get_admin_user),
+):
+    """
+    Stream results joined with users as NDJSON, CSV or Parquet.
+    Reads go through a server-side cursor in batches, so memory stays bounded.
+    """
+    try:
+        export.check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    chunks = export.stream_export(
+        format, gzip=gzip, start=start, end=end, exercise=exercise, location=location
+    )
+    filename = export.export_filename(format, gzip)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if gzip and format != "parquet":
+        return StreamingResponse(chunks, media_type="application/gzip", headers=headers)
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[format], headers=headers)
+
+# -------------------------
+# Admin Profiles
+# -------------------------
+@app.get("/admin/profiles")
+def admin_profiles(admin: models.User = Depends(get_admin_user)):
+    """Newest-first list of stored request profiles."""
+    return {"enabled": PROFILE_ENABLED, "profiles": profiling.profile_store.list()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_profile_download(profile_id: str, admin: models.User = Depends(get_admin_user)):
+    """Download a profile as collapsed stacks (flamegraph.pl / speedscope)."""
+    path = profiling.profile_store.folded_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from khel_backend.database import Base
 import datetime
@@ -34,7 +34,7 @@ class Result(Base):
     __tablename__ = "results"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     exercise = Column(String(50), nullable=False)  # e.g., pushup, situp
     reps = Column(Integer, nullable=False)
     video_url = Column(String(255), nullable=False)
@@ -51,6 +51,50 @@ class Result(Base):
         )
 
 
+# Cold tier of `results`; rows keep their original id
+class ArchivedResult(Base):
+    __tablename__ = "results_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    exercise = Column(String(50), nullable=False)
+    reps = Column(Integer, nullable=False)
+    video_url = Column(String(255), nullable=False)
+    video_hash = Column(String(64), nullable=False)
+    # part of the key so Postgres can range-partition on it
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
+
+    def __repr__(self) -> str:
+        return f"<ArchivedResult(id={self.id}, user_id={self.user_id}, exercise='{self.exercise}')>"
+
+
+# Per-user, per-exercise aggregates of everything in `results_archive`
+class ResultRollup(Base):
+    __tablename__ = "result_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    exercise = Column(String(50), primary_key=True)
+    total_reps = Column(Integer, nullable=False, default=0)
+    sessions = Column(Integer, nullable=False, default=0)
+    best_reps = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"<ResultRollup(user_id={self.user_id}, exercise='{self.exercise}')>"
+
+
+# Sparse reps histograms for /percentile: one row per non-empty bucket of a segment
+class PercentileBucket(Base):
+    __tablename__ = "percentile_buckets"
+
+    exercise = Column(String(50), primary_key=True)
+    age_band = Column(String(10), primary_key=True)  # label, or "" for every band
+    location = Column(String, primary_key=True)  # normalized location, or "" for every location
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
 class Achievement(Base):
     __tablename__ = "achievements"
 
@@ -69,3 +113,48 @@ class Achievement(Base):
 
     def __repr__(self) -> str:
         return f"<Achievement(id={self.id}, user_id={self.user_id}, title='{self.title}')>"
+
+
+# Monotonic per-user change counter used by /sync
+class UserVersion(Base):
+    __tablename__ = "user_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# One row per change: kind is result, achievement or profile; ref_id is the row id
+class UserChange(Base):
+    __tablename__ = "user_changes"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    ref_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_user_changes_user_version", "user_id", "version"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<UserChange(user_id={self.user_id}, version={self.version}, kind='{self.kind}')>"
+
+
+# Stored outcome of a request sent with an Idempotency-Key header
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(100), primary_key=True)
+    endpoint = Column(String(50), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request parameters
+    status = Column(String(10), nullable=False, default="pending")  # pending or done
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<IdempotencyKey(user_id={self.user_id}, key='{self.key}', status='{self.status}')>"
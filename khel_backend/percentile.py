@@ -0,0 +1,209 @@
+import argparse
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from khel_backend import database
+from khel_backend import models
+from khel_backend.config import PERCENTILE_MAX_REPS, PERCENTILE_BUCKET_WIDTH
+from khel_backend.archive import ALL_RESULTS
+
+# -------------------------
+# Segments
+# -------------------------
+# Every result is counted in four segments: (exercise, band, location),
+# (exercise, band, ALL), (exercise, ALL, location) and (exercise, ALL, ALL), so
+# any combination of the optional query filters is a single lookup. ALL is the
+# empty string, which normalize_location() never returns and no band uses.
+ALL = ""
+# wildcard used before ALL; segments still keyed by it are recounted on startup
+_LEGACY_ALL = "all"
+
+AGE_BANDS = [
+    (0, 11, "u12"),
+    (12, 13, "12-13"),
+    (14, 15, "14-15"),
+    (16, 17, "16-17"),
+    (18, 24, "18-24"),
+    (25, 34, "25-34"),
+    (35, 200, "35+"),
+]
+AGE_BAND_LABELS = [label for _, _, label in AGE_BANDS]
+
+
+def age_band_for(age: Optional[int]) -> Optional[str]:
+    if not age or age <= 0:
+        return None
+    for low, high, label in AGE_BANDS:
+        if low <= age <= high:
+            return label
+    return None
+
+
+def normalize_location(location: Optional[str]) -> Optional[str]:
+    if not location or not location.strip():
+        return None
+    return location.strip().lower()
+
+
+def segment_keys(exercise: str, age: Optional[int], location: Optional[str]) -> List[Tuple[str, str, str]]:
+    exercise = exercise.strip().lower()
+    bands = [ALL]
+    band = age_band_for(age)
+    if band:
+        bands.append(band)
+    locations = [ALL]
+    loc = normalize_location(location)
+    if loc:
+        locations.append(loc)
+    return list(dict.fromkeys((exercise, b, l) for b in bands for l in locations))
+
+
+# -------------------------
+# Buckets
+# -------------------------
+# Each segment is a sparse fixed-width histogram in percentile_buckets: only
+# non-empty buckets have a row. Buckets are [i * width, (i + 1) * width) up to
+# PERCENTILE_MAX_REPS, plus one overflow bucket for anything above. Counts are
+# bumped in the same transaction as the result they describe, so every worker
+# answers from the same data and nothing is held in memory.
+_WIDTH = max(1, PERCENTILE_BUCKET_WIDTH)
+_OVERFLOW = PERCENTILE_MAX_REPS // _WIDTH + 1
+
+
+def bucket_for(reps: int) -> int:
+    return min(max(reps, 0) // _WIDTH, _OVERFLOW)
+
+
+def record_percentile(db: Session, exercise: str, reps: int, age: Optional[int], location: Optional[str]):
+    """Count one result in each of its segments; one upsert, caller commits."""
+    keys = segment_keys(exercise, age, location)
+    values, params = [], {"bucket": bucket_for(reps)}
+    for i, (ex, band, loc) in enumerate(keys):
+        values.append(f"(:e{i}, :a{i}, :l{i}, :bucket, 1)")
+        params.update({f"e{i}": ex, f"a{i}": band, f"l{i}": loc})
+    db.execute(
+        text(
+            "INSERT INTO percentile_buckets (exercise, age_band, location, bucket, count) "
+            f"VALUES {', '.join(values)} "
+            "ON CONFLICT (exercise, age_band, location, bucket) "
+            "DO UPDATE SET count = percentile_buckets.count + 1"
+        ),
+        params,
+    )
+
+
+def query_percentile(
+    db: Session, exercise: str, reps: int, age_band: Optional[str] = None, location: Optional[str] = None
+) -> dict:
+    """
+    Percentile of `reps` in one segment, with `error_bound` in percentage points.
+
+    Samples in the same bucket as `reps` are counted as half below, half
+    above (mid-rank), so the answer is off by at most half of that bucket's
+    share of the segment. With the default width of 1 this is exact for
+    reps up to PERCENTILE_MAX_REPS apart from ties.
+    """
+    key = (exercise.strip().lower(), age_band or ALL, normalize_location(location) or ALL)
+    b = bucket_for(reps)
+    below, in_bucket, total = db.execute(
+        text(
+            "SELECT COALESCE(SUM(CASE WHEN bucket < :b THEN count ELSE 0 END), 0), "
+            "COALESCE(SUM(CASE WHEN bucket = :b THEN count ELSE 0 END), 0), "
+            "COALESCE(SUM(count), 0) "
+            "FROM percentile_buckets WHERE exercise = :e AND age_band = :a AND location = :l"
+        ),
+        {"b": b, "e": key[0], "a": key[1], "l": key[2]},
+    ).fetchone()
+    pct, err = None, 0.0
+    if total:
+        pct = round(100.0 * (below + 0.5 * in_bucket) / total, 2)
+        err = round(100.0 * 0.5 * in_bucket / total, 2)
+    return {
+        "exercise": key[0],
+        "reps": reps,
+        "age_band": key[1] or "all",
+        "location": key[2] or "all",
+        "percentile": pct,
+        "sample_size": total,
+        "error_bound": err,
+    }
+
+
+# -------------------------
+# Rebuild
+# -------------------------
+def rebuild_percentiles(db: Session, batch_size: int = 5000) -> int:
+    """
+    Replace every segment with counts from both result tiers, in one
+    transaction. On Postgres the table lock makes concurrent writers wait, so
+    each result is counted exactly once: either in the scan or by its own
+    upsert after the rebuild commits. Returns the number of bucket rows.
+    """
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE percentile_buckets IN EXCLUSIVE MODE"))
+    db.execute(text("DELETE FROM percentile_buckets"))
+    counts: Dict[Tuple[str, str, str, int], int] = {}
+    rows = db.execute(
+        text(
+            "SELECT r.exercise, r.reps, u.age, u.location "
+            f"FROM {ALL_RESULTS} r JOIN users u ON u.id = r.user_id"
+        ).execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for exercise, reps, age, location in rows:
+        b = bucket_for(reps)
+        for ex, band, loc in segment_keys(exercise, age, location):
+            counts[(ex, band, loc, b)] = counts.get((ex, band, loc, b), 0) + 1
+    if counts:
+        db.execute(
+            models.PercentileBucket.__table__.insert(),
+            [
+                {"exercise": ex, "age_band": band, "location": loc, "bucket": b, "count": n}
+                for (ex, band, loc, b), n in counts.items()
+            ],
+        )
+    db.commit()
+    return len(counts)
+
+
+def seed_percentiles():
+    """
+    Backfill on first start after upgrading: rebuild only if nothing is counted
+    yet, or if segments are still keyed by the old "all" wildcard.
+    """
+    db = database.SessionLocal()
+    try:
+        empty = db.execute(text("SELECT 1 FROM percentile_buckets LIMIT 1")).first() is None
+        legacy = db.execute(
+            text("SELECT 1 FROM percentile_buckets WHERE age_band = :all LIMIT 1"), {"all": _LEGACY_ALL}
+        ).first() is not None
+        has_results = db.execute(text(f"SELECT 1 FROM {ALL_RESULTS} r LIMIT 1")).first() is not None
+        if (empty and has_results) or legacy:
+            rebuild_percentiles(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Percentile seed failed: {e}")
+    finally:
+        db.close()
+
+
+# -------------------------
+# CLI
+# -------------------------
+# python -m khel_backend.percentile --rebuild
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the /percentile histograms.")
+    parser.add_argument("--rebuild", action="store_true", help="recount every segment from results")
+    args = parser.parse_args(argv)
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+
+    db = database.SessionLocal()
+    try:
+        rows = rebuild_percentiles(db)
+    finally:
+        db.close()
+    print(f"rebuilt {rows} percentile buckets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from khel_backend import database
+from khel_backend import models
+from khel_backend.auth import decode_token
+from khel_backend.config import (
+    ADMIN_USERNAMES,
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_INTERVAL_MS,
+)
+
+# -------------------------
+# Opt-in request profiling
+# -------------------------
+# Only installed when PROFILE_ENABLED is set, so a normal deployment runs
+# without the middleware, route wrapper or SQL listeners. A request is
+# profiled when an admin sends `X-Profile: 1` or it is picked by
+# PROFILE_SAMPLE_RATE. Output is collapsed stacks ("folded" format), which
+# flamegraph.pl, speedscope and inferno read directly.
+PROFILE_HEADER = b"x-profile"
+# admin user ids are re-read this often, so new admins are picked up without a restart
+_ADMIN_IDS_TTL_SECONDS = 60
+_ID_RE = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.wall_ms = 0.0
+        self.sql_ms = 0.0
+        self.sql_queries = 0
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add_sql(self, seconds: float):
+        with self._lock:
+            self.sql_ms += seconds * 1000
+            self.sql_queries += 1
+
+    def meta(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "wall_ms": round(self.wall_ms, 2),
+            "sql_ms": round(self.sql_ms, 2),
+            "sql_queries": self.sql_queries,
+            "samples": sum(self.stacks.values()),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        }
+
+
+# -------------------------
+# Stack sampler
+# -------------------------
+class _Sampler(threading.Thread):
+    """Samples one thread's Python stack every PROFILE_INTERVAL_MS."""
+
+    def __init__(self, thread_id: int, profile: RequestProfile):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.profile = profile
+        self.interval = PROFILE_INTERVAL_MS / 1000.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.profile.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _profiled(endpoint):
+    """Wrap an endpoint so a profiled request samples the thread it runs on."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            sampler = _Sampler(threading.get_ident(), profile)
+            sampler.start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                sampler.stop()
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        sampler = _Sampler(threading.get_ident(), profile)
+        sampler.start()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            sampler.stop()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+# -------------------------
+# SQL timing
+# -------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    starts = conn.info.get("profile_query_start")
+    if profile is not None and starts:
+        profile.add_sql(time.perf_counter() - starts.pop())
+
+
+# -------------------------
+# Ring buffer storage
+# -------------------------
+class ProfileStore:
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, profile: RequestProfile):
+        os.makedirs(self.directory, exist_ok=True)
+        folded = "".join(f"{stack} {count}\n" for stack, count in profile.stacks.items())
+        with self._lock:
+            with open(os.path.join(self.directory, f"{profile.id}.folded"), "w") as f:
+                f.write(folded)
+            with open(os.path.join(self.directory, f"{profile.id}.json"), "w") as f:
+                json.dump(profile.meta(), f)
+            # ids start with a millisecond timestamp, so name order is age order
+            ids = self._ids()
+            for old in ids[: max(0, len(ids) - self.max_files)]:
+                for ext in (".folded", ".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, old + ext))
+                    except FileNotFoundError:
+                        pass
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def list(self) -> List[dict]:
+        out = []
+        for pid in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, f"{pid}.json")) as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # rotated out while listing
+        return out
+
+    def folded_path(self, profile_id: str) -> Optional[str]:
+        if not _ID_RE.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
+
+
+profile_store = ProfileStore()
+
+
+# -------------------------
+# Middleware
+# -------------------------
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, store: ProfileStore = profile_store):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.store = store
+        self._admin_ids = set()
+        self._admin_ids_expire = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current.set(profile)
+
+        async def capture_status(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture_status)
+        finally:
+            _current.reset(token)
+            profile.wall_ms = (time.perf_counter() - profile.started) * 1000
+            try:
+                self.store.save(profile)
+            except OSError as e:
+                print(f"Profile save failed: {e}")
+
+    async def _should_profile(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) not in (b"1", b"true"):
+            return False
+        return await self._is_admin(headers)
+
+    async def _is_admin(self, headers: dict) -> bool:
+        auth = headers.get(b"authorization", b"").decode("latin-1")
+        if not auth.lower().startswith("bearer "):
+            return False
+        try:
+            user_id = int(decode_token(auth[7:], expected_type="access"))
+        except (HTTPException, TypeError, ValueError):
+            return False
+        if time.monotonic() >= self._admin_ids_expire:
+            # off the event loop; only X-Profile requests ever get here
+            self._admin_ids = await run_in_threadpool(_load_admin_ids)
+            self._admin_ids_expire = time.monotonic() + _ADMIN_IDS_TTL_SECONDS
+        return user_id in self._admin_ids
+
+
+def _load_admin_ids() -> set:
+    db = database.ReadSessionLocal()
+    try:
+        rows = db.query(models.User.id).filter(models.User.username.in_(ADMIN_USERNAMES)).all()
+        return {r[0] for r in rows}
+    finally:
+        db.close()
+
+
+def install(app):
+    """Enable profiling on `app`; call before any routes are declared."""
+    app.router.route_class = ProfiledRoute
+    app.add_middleware(ProfilingMiddleware)
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,330 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+from khel_backend import database
+from khel_backend import models
+from khel_backend.achievements import distinct_exercises, evaluate_catalog
+from khel_backend.archive import ensure_indexes, lock_rollups
+from khel_backend.cache import cache
+from khel_backend.config import (
+    DATABASE_URL,
+    RECOMPUTE_CHUNK_SIZE,
+    RECOMPUTE_WORKERS,
+    RECOMPUTE_CHECKPOINT,
+)
+from khel_backend.sync import record_changes
+
+# -------------------------
+# Batch recompute of derived per-user state
+# -------------------------
+# Users are split into keyset ranges (lo, hi] on users.id and each range is
+# recomputed in a worker process holding a single connection:
+#
+#   1. result_rollups for the range are rebuilt from results_archive with one
+#      upsert that only touches rows whose totals/bests differ, plus one
+#      delete of rollups with no archived rows left.
+#   2. Per-user totals are read in two grouped range scans (hot results and
+#      the rebuilt rollups), the achievements catalog is evaluated in Python,
+#      and newly earned achievements are bulk-inserted.
+#
+# Like /achievements/me, earned achievements are never revoked. Ranges are
+# idempotent, so a resumed run may safely redo chunks finished after the
+# checkpoint. Rollup rebuilds and archival batches serialize on
+# archive.lock_rollups(), so the CLI is safe to run while the API archives.
+
+_Session: Optional[sessionmaker] = None
+
+
+def _init_worker(url: str):
+    global _Session
+    # connections inherited from the parent must not be shared across processes
+    database.engine.dispose(close=False)
+    engine = database._create_engine(url, pool_size=1, max_overflow=0)
+    if url.startswith("sqlite"):
+        # SQLite has one writer; workers queue for it instead of failing
+        @event.listens_for(engine, "connect")
+        def _set_busy_timeout(dbapi_conn, _):
+            dbapi_conn.execute("PRAGMA busy_timeout = 60000")
+    _Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _rebuild_rollups(db, params) -> set:
+    """Make result_rollups for the range match results_archive; returns affected user ids."""
+    # statements after the lock see every archival batch committed before it
+    lock_rollups(db)
+    changed = db.execute(
+        text(
+            "INSERT INTO result_rollups (user_id, exercise, total_reps, sessions, best_reps) "
+            "SELECT user_id, exercise, SUM(reps), COUNT(*), MAX(reps) FROM results_archive "
+            "WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id, exercise "
+            "ON CONFLICT (user_id, exercise) DO UPDATE SET "
+            "total_reps = excluded.total_reps, sessions = excluded.sessions, best_reps = excluded.best_reps "
+            "WHERE result_rollups.total_reps <> excluded.total_reps "
+            "OR result_rollups.sessions <> excluded.sessions "
+            "OR result_rollups.best_reps <> excluded.best_reps "
+            "RETURNING user_id"
+        ),
+        params,
+    ).scalars().all()
+    stale = db.execute(
+        text(
+            "DELETE FROM result_rollups WHERE user_id > :lo AND user_id <= :hi AND NOT EXISTS ("
+            "SELECT 1 FROM results_archive a "
+            "WHERE a.user_id = result_rollups.user_id AND a.exercise = result_rollups.exercise) "
+            "RETURNING user_id"
+        ),
+        params,
+    ).scalars().all()
+    return set(changed) | set(stale)
+
+
+def _range_totals(db, params):
+    """Per-user exercise totals and session counts across both tiers for the range."""
+    exercise_totals: Dict[int, Dict[str, int]] = defaultdict(dict)
+    sessions: Dict[int, int] = defaultdict(int)
+    rows = db.execute(
+        text(
+            "SELECT user_id, exercise, SUM(reps), COUNT(*) FROM results "
+            "WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id, exercise "
+            "UNION ALL "
+            "SELECT user_id, exercise, total_reps, sessions FROM result_rollups "
+            "WHERE user_id > :lo AND user_id <= :hi"
+        ),
+        params,
+    )
+    for user_id, exercise, total, count in rows:
+        totals = exercise_totals[user_id]
+        totals[exercise.lower()] = totals.get(exercise.lower(), 0) + total
+        sessions[user_id] += count
+    return exercise_totals, sessions
+
+
+def recompute_chunk(lo: int, hi: int, exercises: List[str], rollups: bool = True) -> dict:
+    """Recompute users with lo < id <= hi. Runs in a worker process."""
+    db = _Session()
+    params = {"lo": lo, "hi": hi}
+    try:
+        user_ids = db.execute(
+            text("SELECT id FROM users WHERE id > :lo AND id <= :hi ORDER BY id"), params
+        ).scalars().all()
+
+        touched = set()
+        if rollups:
+            touched = _rebuild_rollups(db, params)
+            db.commit()
+
+        exercise_totals, sessions = _range_totals(db, params)
+        persisted = defaultdict(set)
+        for user_id, title in db.execute(
+            text("SELECT user_id, title FROM achievements WHERE user_id > :lo AND user_id <= :hi"), params
+        ):
+            persisted[user_id].add(title)
+
+        now = datetime.datetime.utcnow()
+        new_rows = []
+        for user_id in user_ids:
+            totals = exercise_totals.get(user_id, {})
+            catalog = evaluate_catalog(
+                sum(totals.values()), sessions.get(user_id, 0), totals, exercises, persisted[user_id]
+            )
+            for title, desc, points, earned, progress in catalog:
+                if earned and title not in persisted[user_id]:
+                    new_rows.append({"user_id": user_id, "title": title, "description": desc, "earned_at": now})
+
+        awarded = 0
+        if new_rows:
+            table = models.Achievement.__table__
+            stmt = (
+                database.dialect_insert(db)(table)
+                .on_conflict_do_nothing(index_elements=["user_id", "title"])
+                .returning(table.c.id, table.c.user_id)
+            )
+            by_user = defaultdict(list)
+            for ach_id, user_id in db.execute(stmt, new_rows):
+                by_user[user_id].append(ach_id)
+                awarded += 1
+            record_changes(db, "achievement", by_user)
+            db.commit()
+
+        # dashboards and profiles embed totals; the leaderboard expires on its own
+        for user_id in touched:
+            cache.invalidate(f"user:{user_id}")
+        return {"hi": hi, "users": len(user_ids), "achievements": awarded, "rollups": len(touched)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# -------------------------
+# Checkpoint
+# -------------------------
+def load_checkpoint(path: str) -> int:
+    try:
+        with open(path) as f:
+            return int(json.load(f)["last_id"])
+    except FileNotFoundError:
+        return 0
+
+
+def save_checkpoint(path: str, last_id: int, stats: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_id": last_id, "updated_at": datetime.datetime.utcnow().isoformat(), **stats}, f)
+    os.replace(tmp, path)
+
+
+# -------------------------
+# Driver
+# -------------------------
+def _chunks(db, start: int, chunk_size: int):
+    """Yield keyset ranges (lo, hi] of at most chunk_size users each."""
+    lo = start
+    while True:
+        hi = db.execute(
+            text("SELECT id FROM users WHERE id > :lo ORDER BY id LIMIT 1 OFFSET :n"),
+            {"lo": lo, "n": chunk_size - 1},
+        ).scalar()
+        if hi is None:
+            hi = db.execute(text("SELECT MAX(id) FROM users WHERE id > :lo"), {"lo": lo}).scalar()
+            if hi is not None:
+                yield lo, hi
+            return
+        yield lo, hi
+        lo = hi
+
+
+def _format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s"
+
+
+def run_recompute(
+    workers: int = RECOMPUTE_WORKERS,
+    chunk_size: int = RECOMPUTE_CHUNK_SIZE,
+    checkpoint: Optional[str] = RECOMPUTE_CHECKPOINT,
+    resume: bool = False,
+    rollups: bool = True,
+    report_seconds: float = 5.0,
+    url: str = DATABASE_URL,
+) -> dict:
+    """
+    Recompute all users in parallel. The checkpoint holds the highest user id
+    below which every chunk has committed, so out-of-order completion never
+    skips a range on resume.
+    """
+    start = load_checkpoint(checkpoint) if resume and checkpoint else 0
+
+    # the range scans below rely on these
+    ensure_indexes()
+
+    db = database.SessionLocal()
+    try:
+        if rollups:
+            # rollups are about to be rebuilt, so read exercises from the source rows
+            exercises = list({
+                r[0].lower()
+                for r in db.execute(
+                    text("SELECT DISTINCT exercise FROM results UNION SELECT DISTINCT exercise FROM results_archive")
+                )
+            })
+        else:
+            exercises = distinct_exercises(db)
+        total = db.execute(text("SELECT COUNT(*) FROM users WHERE id > :lo"), {"lo": start}).scalar()
+        stats = {"users": 0, "achievements": 0, "rollups": 0}
+        print(f"recomputing {total} users from id > {start} with {workers} workers, chunks of {chunk_size}")
+
+        started = time.monotonic()
+        next_report = started + report_seconds
+        order: List[int] = []  # chunk upper bounds in submission order
+        done = set()
+        watermark = start
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(url,)) as pool:
+            chunks = _chunks(db, start, chunk_size)
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # keep a bounded window of chunks in flight
+                while not exhausted and len(pending) < workers * 2:
+                    bounds = next(chunks, None)
+                    if bounds is None:
+                        exhausted = True
+                        break
+                    order.append(bounds[1])
+                    pending.add(pool.submit(recompute_chunk, bounds[0], bounds[1], exercises, rollups))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    done.add(result["hi"])
+                    for key in stats:
+                        stats[key] += result[key]
+
+                advanced = False
+                while order and order[0] in done:
+                    watermark = order.pop(0)
+                    done.discard(watermark)
+                    advanced = True
+                if advanced and checkpoint:
+                    save_checkpoint(checkpoint, watermark, stats)
+
+                now = time.monotonic()
+                if now >= next_report:
+                    rate = stats["users"] / (now - started)
+                    eta = (total - stats["users"]) / rate if rate else 0
+                    print(
+                        f"{stats['users']}/{total} users ({stats['users'] / max(total, 1):.1%}) "
+                        f"{rate:,.0f} users/s, eta {_format_eta(eta)}; "
+                        f"+{stats['achievements']} achievements, {stats['rollups']} rollups fixed"
+                    )
+                    next_report = now + report_seconds
+    finally:
+        db.close()
+
+    elapsed = time.monotonic() - started
+    stats["seconds"] = round(elapsed, 1)
+    print(
+        f"done: {stats['users']} users in {_format_eta(elapsed)} "
+        f"({stats['users'] / max(elapsed, 1e-9):,.0f} users/s); "
+        f"+{stats['achievements']} achievements, {stats['rollups']} rollups fixed"
+    )
+    return stats
+
+
+# -------------------------
+# CLI
+# -------------------------
+# python -m khel_backend.recompute --workers 8 --resume
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute achievements, totals and bests for all users.")
+    parser.add_argument("--workers", type=int, default=RECOMPUTE_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=RECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--checkpoint", default=RECOMPUTE_CHECKPOINT)
+    parser.add_argument("--resume", action="store_true", help="continue after the checkpointed user id")
+    parser.add_argument("--skip-rollups", action="store_true", help="only award achievements")
+    parser.add_argument("--report-seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be positive")
+
+    run_recompute(
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+        rollups=not args.skip_rollups,
+        report_seconds=args.report_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+from khel_backend import models
+from khel_backend.database import dialect_insert
+from khel_backend.archive import ALL_RESULTS
+from khel_backend.config import SYNC_LOG_RETENTION_DAYS
+
+# -------------------------
+# Change tracking
+# -------------------------
+# Writers call record_change() inside their own transaction: one upsert on
+# user_versions and one insert into user_changes, nothing else.
+
+
+def record_change(db: Session, user_id: int, kind: str, ref_id: Optional[int] = None) -> int:
+    version = db.execute(
+        text(
+            "INSERT INTO user_versions (user_id, version) VALUES (:uid, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = user_versions.version + 1 "
+            "RETURNING version"
+        ),
+        {"uid": user_id},
+    ).scalar()
+    db.add(models.UserChange(user_id=user_id, version=version, kind=kind, ref_id=ref_id))
+    return version
+
+
+def record_changes(db: Session, kind: str, refs: Dict[int, List[int]]):
+    """
+    record_change() for many users at once: one batched upsert bumps each
+    user's version by their number of changes, one batched insert logs them.
+    """
+    if not refs:
+        return
+    versions = models.UserVersion.__table__
+    stmt = dialect_insert(db)(versions)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[versions.c.user_id],
+        set_={"version": versions.c.version + stmt.excluded.version},
+    ).returning(versions.c.user_id, versions.c.version)
+    rows = db.execute(stmt, [{"user_id": uid, "version": len(ids)} for uid, ids in refs.items()])
+    now = datetime.datetime.utcnow()
+    changes = []
+    for user_id, version in rows:
+        ids = refs[user_id]
+        first = version - len(ids) + 1
+        changes.extend(
+            {"user_id": user_id, "version": first + i, "kind": kind, "ref_id": ref_id, "created_at": now}
+            for i, ref_id in enumerate(ids)
+        )
+    db.execute(models.UserChange.__table__.insert(), changes)
+
+
+def current_version(db: Session, user_id: int) -> int:
+    return db.execute(
+        text("SELECT version FROM user_versions WHERE user_id = :uid"), {"uid": user_id}
+    ).scalar() or 0
+
+
+def prune_changes(db: Session, retention_days: int = SYNC_LOG_RETENTION_DAYS) -> int:
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    deleted = db.execute(
+        text("DELETE FROM user_changes WHERE created_at < :cutoff"), {"cutoff": cutoff}
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+# -------------------------
+# Delta
+# -------------------------
+def _result_rows(db: Session, user_id: int, ids=None):
+    query = (
+        "SELECT id, exercise, reps, timestamp, video_url "
+        f"FROM {ALL_RESULTS} r WHERE user_id = :uid"
+    )
+    params = {"uid": user_id}
+    stmt = text(query + " ORDER BY timestamp DESC")
+    if ids is not None:
+        stmt = text(query + " AND id IN :ids ORDER BY timestamp DESC").bindparams(
+            bindparam("ids", expanding=True)
+        )
+        params["ids"] = list(ids)
+    return [
+        {"id": r[0], "exercise": r[1], "reps": r[2], "timestamp": str(r[3]), "video_url": r[4]}
+        for r in db.execute(stmt, params).fetchall()
+    ]
+
+
+def _achievement_rows(db: Session, user_id: int, ids=None):
+    query = db.query(models.Achievement).filter_by(user_id=user_id)
+    if ids is not None:
+        query = query.filter(models.Achievement.id.in_(list(ids)))
+    return [
+        {
+            "id": a.id,
+            "title": a.title,
+            "description": a.description,
+            "earned_at": str(a.earned_at) if a.earned_at else None,
+        }
+        for a in query.all()
+    ]
+
+
+def changes_since(db: Session, user_id: int, since: int) -> dict:
+    """
+    Results, achievements and whether the profile changed after `since`.
+    Falls back to a full snapshot when `since` is 0, ahead of the server,
+    or older than the retained change log.
+    """
+    version = current_version(db, user_id)
+    if since > 0 and since == version:
+        return {"version": version, "full": False, "results": [], "achievements": [], "profile_changed": False}
+
+    oldest = db.execute(
+        text("SELECT MIN(version) FROM user_changes WHERE user_id = :uid"), {"uid": user_id}
+    ).scalar()
+    full = since <= 0 or since > version or oldest is None or since < oldest - 1
+    if full:
+        return {
+            "version": version,
+            "full": True,
+            "results": _result_rows(db, user_id),
+            "achievements": _achievement_rows(db, user_id),
+            "profile_changed": True,
+        }
+
+    rows = db.execute(
+        text(
+            "SELECT kind, ref_id FROM user_changes "
+            "WHERE user_id = :uid AND version > :since AND version <= :version"
+        ),
+        {"uid": user_id, "since": since, "version": version},
+    ).fetchall()
+    result_ids = {r[1] for r in rows if r[0] == "result"}
+    achievement_ids = {r[1] for r in rows if r[0] == "achievement"}
+    return {
+        "version": version,
+        "full": False,
+        "results": _result_rows(db, user_id, result_ids) if result_ids else [],
+        "achievements": _achievement_rows(db, user_id, achievement_ids) if achievement_ids else [],
+        # total_reps lives on the profile, so new results change it too
+        "profile_changed": any(r[0] in ("profile", "result") for r in rows),
+    }